@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Dict, List
+
+STAGES = {
+    "auth": [
+        ("src.services.auth_service", "get_current_user"),
+        ("src.services.auth_service", "register_user"),
+        ("src.services.auth_service", "authenticate_user"),
+    ],
+    "db": [
+        ("src.services.chat_service", "create_session"),
+        ("src.services.chat_service", "get_session"),
+        ("src.services.chat_service", "begin_turn"),
+        ("src.services.chat_service", "persist_turn"),
+    ],
+    "context": [
+        ("src.services.chat_service", "get_chat_context"),
+    ],
+    "generation": [
+        ("src.services.llm_service", "agenerate_response"),
+        ("src.services.llm_service", "stream_response"),
+    ],
+    "logging": [
+        ("src.services.logging_service", "log_event"),
+    ],
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test for the NeuroChat chat API with a stub model and fake Mongo")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=30, help="tokens produced by the stub model per reply")
+    parser.add_argument("--token-delay-ms", type=float, default=20.0, help="stub model delay per token")
+    parser.add_argument("--stream", action="store_true", help="use /chat/message/stream instead of /chat/message")
+    parser.add_argument("--bcrypt-rounds", type=int, default=None)
+    parser.add_argument("--mongo-uri", default="mongomock://benchmark")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ.setdefault("MODEL_LOAD_ON_STARTUP", "false")
+    os.environ.setdefault("TELEMETRY_MLFLOW_ENABLED", "false")
+    os.environ.setdefault("ADMISSION_BURST", str(args.messages))
+    if args.bcrypt_rounds is not None:
+        os.environ["AUTH_BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubProcessor:
+    def __init__(self, tokens: int, token_delay: float):
+        self.model = "stub"
+        self.tokens = tokens
+        self.token_delay = token_delay
+
+    def _reply(self, messages: List[Dict]) -> List[str]:
+        words = messages[-1]["content"].split() or ["..."]
+        return [words[i % len(words)] for i in range(self.tokens)]
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    def truncate_tokens(self, text: str, max_tokens: int):
+        words = text.split()
+        return " ".join(words[:max_tokens]), min(len(words), max_tokens)
+
+    def generate_response(self, messages: List[Dict], use_cache: bool = True):
+        time.sleep(self.tokens * self.token_delay)
+        return " ".join(self._reply(messages)), self.tokens
+
+    async def agenerate_response(self, messages: List[Dict], use_cache: bool = True):
+        await asyncio.sleep(self.tokens * self.token_delay)
+        return " ".join(self._reply(messages)), self.tokens
+
+    async def asummarize(self, summary: str, turns: List[Dict]):
+        await asyncio.sleep(self.tokens * self.token_delay)
+        words = " ".join(turn["content"] for turn in turns).split()
+        return " ".join(words[:self.tokens])
+
+    def stream_response(self, messages: List[Dict], use_cache: bool = True):
+        for i, word in enumerate(self._reply(messages)):
+            time.sleep(self.token_delay)
+            yield word if i == 0 else f" {word}"
+
+    def runtime_stats(self) -> dict:
+        return {}
+
+    def shutdown(self):
+        pass
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, stage: str, started: float):
+        self.samples[stage].append(time.perf_counter() - started)
+
+    def wrap(self, stage: str, func):
+        timer = self
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    timer.record(stage, started)
+        elif func.__name__ == "stream_response":
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                finally:
+                    timer.record(stage, started)
+        else:
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    timer.record(stage, started)
+        return timed
+
+    def install(self, app):
+        import importlib
+        for stage, targets in STAGES.items():
+            for module_name, attr in targets:
+                module = importlib.import_module(module_name)
+                original = getattr(module, attr)
+                timed = self.wrap(stage, original)
+                setattr(module, attr, timed)
+                app.dependency_overrides[original] = timed
+
+
+def install_stub_model(processor: StubProcessor):
+    from src.services import llm_service
+    future = Future()
+    future.set_result(processor)
+    llm_service._processor = processor
+    llm_service._load_future = future
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, name="benchmark-server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Benchmark server failed to start")
+        time.sleep(0.01)
+    return server, thread
+
+
+class Recorder:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.ttfb = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, client, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        async with client.stream(method, url, **kwargs) as response:
+            first_byte = None
+            body = b""
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter()
+                body += chunk
+        finished = time.perf_counter()
+        self.latency[name].append(finished - started)
+        self.ttfb[name].append((first_byte or finished) - started)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            raise RuntimeError(f"{name} failed with {response.status_code}: {body[:200]!r}")
+        return body
+
+
+async def simulate_user(client, recorder: Recorder, args, index: int):
+    username = f"bench_{index}_{uuid.uuid4().hex[:8]}"
+    password = "benchmark-password"
+    await recorder.request(client, "register", "POST", "/api/auth/register",
+                           json={"username": username, "email": f"{username}@example.com", "password": password})
+    body = await recorder.request(client, "login", "POST", "/api/auth/login",
+                                  data={"username": username, "password": password})
+    headers = {"Authorization": f"Bearer {json.loads(body)['access_token']}"}
+    body = await recorder.request(client, "create_session", "POST", "/api/chat/session", json={}, headers=headers)
+    session_id = json.loads(body)["session_id"]
+    endpoint = "/api/chat/message/stream" if args.stream else "/api/chat/message"
+    for turn in range(args.messages):
+        await recorder.request(client, "message", "POST", endpoint, headers=headers, json={
+            "role": "user", "content": f"Question {turn} from {username}: how does MongoDB indexing work?",
+            "session_id": session_id, "use_cache": False
+        })
+
+
+def summarize(samples: List[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+async def drive(port: int, recorder: Recorder, args) -> float:
+    import httpx
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=300) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(simulate_user(client, recorder, args, i) for i in range(args.users)), return_exceptions=True
+        )
+        elapsed = time.perf_counter() - started
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"user failed: {result}", file=sys.stderr)
+    return elapsed
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+
+    from src.main import app
+    install_stub_model(StubProcessor(args.tokens, args.token_delay_ms / 1000))
+    timer = StageTimer()
+    timer.install(app)
+
+    port = free_port()
+    server, thread = start_server(app, port)
+    recorder = Recorder()
+    try:
+        elapsed = asyncio.run(drive(port, recorder, args))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=30)
+
+    total = sum(len(samples) for samples in recorder.latency.values())
+    report = {
+        "config": vars(args),
+        "duration_s": elapsed,
+        "requests": total,
+        "errors": dict(recorder.errors),
+        "requests_per_second": total / elapsed if elapsed else 0.0,
+        "messages_per_second": len(recorder.latency["message"]) / elapsed if elapsed else 0.0,
+        "endpoints": {
+            name: {"latency": summarize(samples), "ttfb": summarize(recorder.ttfb[name])}
+            for name, samples in recorder.latency.items()
+        },
+        "stages": {stage: summarize(timer.samples[stage]) for stage in STAGES},
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
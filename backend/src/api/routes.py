@@ -1,116 +1,212 @@
-from fastapi import APIRouter, HTTPException, Depends, Response
+import json
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import iterate_in_threadpool
+from src.config import settings
 from src.models import schemas
 from datetime import datetime
 from src.services import auth_service, chat_service, llm_service, logging_service, monitoring_service
+from src.services.admission import RATE_LIMITED, AdmissionRejected, AdmissionSlot, admission
+from src.services.telemetry import telemetry_sink
+from src.monitoring.prometheus_metrics import current_trace, stage
 
 router = APIRouter()
 
 @router.post("/auth/register", response_model=schemas.UserOut)
-def register(user: schemas.UserCreate):
-    created_user = auth_service.register_user(user)
+async def register(user: schemas.UserCreate):
+    created_user = await auth_service.register_user(user)
     return created_user
 
 @router.post("/auth/login", response_model=schemas.Token)
-def login(response: Response, form_data: OAuth2PasswordRequestForm = Depends()):
-    user = auth_service.authenticate_user(form_data.username, form_data.password)
+async def login(response: Response, form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await auth_service.authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Неверное имя пользователя или пароль")
-    access_token = auth_service.create_access_token(data={"sub": user["username"]})
+    access_token = auth_service.create_access_token(data=auth_service.principal_claims(user))
     response.set_cookie(key="access_token", value=access_token, httponly=True)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.delete("/auth/delete", response_model=dict)
-def delete_account(current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
-    from src.db.mongo_client import get_db
-    db = get_db()
-    result = db.Users.delete_one({"username": current_user.username})
+async def delete_account(current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
+    from src.db.mongo_client import get_async_db
+    db = get_async_db()
+    result = await db.Users.delete_one({"username": current_user.username})
     if result.deleted_count == 1:
-        db.Sessions.delete_many({"user_id": current_user.username})
-        db.Messages.delete_many({"user_id": current_user.username})
+        auth_service.invalidate_principal(current_user.username)
+        await db.Sessions.delete_many({"user_id": current_user.username})
+        await db.Messages.delete_many({"user_id": current_user.username})
         return {"status": "success", "message": "Аккаунт удален"}
     else:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
 @router.post("/chat/session", response_model=dict)
-def create_chat_session(session: schemas.Session,
+async def create_chat_session(session: schemas.Session,
                         current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
     session.user_id = current_user.username
-    session_id = chat_service.create_session(session.dict())
+    session_id = await chat_service.create_session(session.dict())
     return {"session_id": session_id}
 
-@router.get("/chat/sessions", response_model=dict)
-def list_chat_sessions(current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
-    sessions = chat_service.list_sessions(current_user.username)
-    return {"sessions": sessions}
+def _page_size(limit: Optional[int]) -> int:
+    return max(1, min(limit or settings.CHAT_PAGE_SIZE, settings.CHAT_MAX_PAGE_SIZE))
+
+def _json_page(key: str, items: List[dict], next_cursor: Optional[str], **fields) -> StreamingResponse:
+    async def body():
+        yield "{"
+        for name, value in fields.items():
+            yield f"{json.dumps(name)}: {json.dumps(value, ensure_ascii=False)}, "
+        yield f"{json.dumps(key)}: ["
+        for index, item in enumerate(items):
+            yield ("," if index else "") + json.dumps(item, ensure_ascii=False, default=str)
+        yield f"], \"next_cursor\": {json.dumps(next_cursor)}}}"
+    return StreamingResponse(body(), media_type="application/json")
+
+@router.get("/chat/sessions")
+async def list_chat_sessions(limit: Optional[int] = None, cursor: Optional[str] = None,
+                             current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
+    try:
+        sessions, next_cursor = await chat_service.list_sessions(current_user.username, _page_size(limit), cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return _json_page("sessions", sessions, next_cursor)
 
 @router.delete("/chat/session/{session_id}", response_model=dict)
-def delete_chat_session(session_id: str, current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
-    session_doc = chat_service.get_session(session_id)
+async def delete_chat_session(session_id: str, current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
+    session_doc = await chat_service.get_session(session_id)
     if not session_doc or session_doc.get("user_id") != current_user.username:
         raise HTTPException(status_code=404, detail="Сессия не найдена")
-    chat_service.delete_session(session_id)
-    chat_service.delete_session_messages(session_id)
+    await chat_service.delete_session(session_id)
+    await chat_service.delete_session_messages(session_id)
     return {"status": "success", "message": "Сессия успешно удалена"}
 
-@router.get("/chat/session/{session_id}", response_model=dict)
-def get_session_history(session_id: str, current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
-    session_doc = chat_service.get_session(session_id)
+@router.get("/chat/session/{session_id}")
+async def get_session_history(session_id: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                              current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
+    session_doc = await chat_service.get_session(session_id)
     if not session_doc or session_doc.get("user_id") != current_user.username:
         raise HTTPException(status_code=404, detail="Сессия не найдена")
-    messages = chat_service.get_session_messages(session_id)
-    return {"session_id": session_id, "messages": messages}
+    try:
+        messages, next_cursor = await chat_service.get_session_messages(session_id, _page_size(limit), cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return _json_page("messages", messages, next_cursor, session_id=session_id)
 
-@router.post("/chat/message", response_model=dict)
-def post_message(
-        message: schemas.Message,
-        current_user: schemas.UserOut = Depends(auth_service.get_current_user)
-):
+async def _admission_slot(current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
+    if not settings.ADMISSION_ENABLED:
+        yield AdmissionSlot()
+        return
+    try:
+        with stage("admission"):
+            slot = await admission.acquire(current_user.username)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429 if e.reason == RATE_LIMITED else 503,
+            detail="Слишком много запросов, попробуйте позже" if e.reason == RATE_LIMITED
+            else "Сервер перегружен, попробуйте позже",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    try:
+        yield slot
+    finally:
+        slot.release()
+
+def _session_title(message: schemas.Message) -> str:
+    return f"{message.content[:30]}..."
+
+async def _resolve_session(message: schemas.Message, current_user: schemas.UserOut) -> chat_service.ChatTurn:
     if not message.session_id:
         session_data = {
             "user_id": current_user.username,
             "metadata": {
                 "initial_message": message.content[:50],
-                "created_from": "home_page"
+                "created_from": "home_page",
+                "title": _session_title(message)
             }
         }
-        message.session_id = chat_service.create_session(session_data)
-    else:
-        session_doc = chat_service.get_session(message.session_id)
-        if not session_doc or session_doc.get("user_id") != current_user.username:
-            raise HTTPException(status_code=404, detail="Сессия не найдена")
+        message.session_id = await chat_service.create_session(session_data)
+        return await chat_service.begin_turn(message.session_id, new_session=True)
+    session_doc = await chat_service.get_session(message.session_id)
+    if not session_doc or session_doc.get("user_id") != current_user.username:
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+    title = None if session_doc.get("metadata", {}).get("title") else _session_title(message)
+    return await chat_service.begin_turn(
+        message.session_id, title, summary=session_doc.get("summary"),
+        last_message_at=session_doc.get("last_message_at")
+    )
 
-    message_data = {
-        "session_id": message.session_id,
-        "user_id": current_user.username,
-        "role": "user",
-        "content": message.content
-    }
-    user_msg_id = chat_service.save_message(message_data)
+async def _start_turn(message: schemas.Message, current_user: schemas.UserOut) -> Tuple[chat_service.ChatTurn, str]:
+    with stage("session_check"):
+        turn = await _resolve_session(message, current_user)
+    return turn, turn.add_message("user", current_user.username, message.content)
 
-    context = chat_service.get_chat_context(message.session_id)
-    bot_response_text, tokens_used = llm_service.generate_response(context)
+async def _chat_context(message: schemas.Message, turn: chat_service.ChatTurn):
+    with stage("context"):
+        return await chat_service.get_chat_context(
+            message.session_id, llm_service.get_token_truncator(), summary=turn.summary, pending=turn.turns
+        )
 
-    bot_message = {
-        "session_id": message.session_id,
-        "user_id": "bot",
-        "role": "assistant",
-        "content": bot_response_text
-    }
-    bot_msg_id = chat_service.save_message(bot_message)
+async def _summarize_if_needed(turn: chat_service.ChatTurn):
+    truncate = llm_service.get_token_truncator()
+    if chat_service.needs_summary(turn.session_id, turn.summary, truncate):
+        await chat_service.update_summary(turn.session_id, llm_service.asummarize, truncate)
 
-    chat_service.update_session_title(
-        message.session_id,
-        f"{message.content[:30]}..."
-    )
+def _summary_task(turn: chat_service.ChatTurn) -> Optional[BackgroundTask]:
+    if not settings.SUMMARY_ENABLED:
+        return None
+    return BackgroundTask(_summarize_if_needed, turn)
+
+async def _finish_turn(message: schemas.Message, turn: chat_service.ChatTurn, user_msg_id: str,
+                       bot_response_text: str, tokens_used: int):
+    turn.add_message("assistant", "bot", bot_response_text)
+    with stage("db_write"):
+        await chat_service.persist_turn(turn)
+
+    trace = current_trace()
+    with stage("logging"):
+        logging_service.log_event({
+            "session_id": message.session_id,
+            "message_id": user_msg_id,
+            "processing_time": trace.elapsed(),
+            "tokens_used": tokens_used,
+            "stages": dict(trace.spans),
+            "status": "success"
+        })
 
+def _generation_failed(message: schemas.Message, user_msg_id: str) -> HTTPException:
+    trace = current_trace()
     logging_service.log_event({
         "session_id": message.session_id,
         "message_id": user_msg_id,
-        "processing_time": 0.5,
-        "tokens_used": tokens_used,
-        "status": "success"
+        "processing_time": trace.elapsed(),
+        "stages": dict(trace.spans),
+        "status": "error"
     })
+    return HTTPException(status_code=503, detail="Не удалось сгенерировать ответ, попробуйте позже")
+
+@router.post("/chat/message", response_model=dict)
+async def post_message(
+        message: schemas.Message,
+        background_tasks: BackgroundTasks,
+        current_user: schemas.UserOut = Depends(auth_service.get_current_user),
+        slot: AdmissionSlot = Depends(_admission_slot)
+):
+    turn, user_msg_id = await _start_turn(message, current_user)
+
+    context = await _chat_context(message, turn)
+    try:
+        with stage("generation"):
+            bot_response_text, tokens_used = await llm_service.agenerate_response(context, message.use_cache)
+    except llm_service.GenerationError:
+        raise _generation_failed(message, user_msg_id)
+    finally:
+        slot.release()
+
+    await _finish_turn(message, turn, user_msg_id, bot_response_text, tokens_used)
+    summary_task = _summary_task(turn)
+    if summary_task:
+        background_tasks.add_task(summary_task)
 
     return {
         "status": "success",
@@ -118,6 +214,47 @@ def post_message(
         "bot_content": bot_response_text
     }
 
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/message/stream")
+async def post_message_stream(
+        message: schemas.Message,
+        current_user: schemas.UserOut = Depends(auth_service.get_current_user),
+        slot: AdmissionSlot = Depends(_admission_slot)
+):
+    turn, user_msg_id = await _start_turn(message, current_user)
+    context = await _chat_context(message, turn)
+
+    async def event_stream():
+        parts = []
+        yield _sse({"type": "session", "session_id": message.session_id})
+        try:
+            with stage("generation"):
+                async for delta in iterate_in_threadpool(llm_service.stream_response(context, message.use_cache)):
+                    parts.append(delta)
+                    yield _sse({"type": "token", "content": delta})
+        except llm_service.GenerationError:
+            error = _generation_failed(message, user_msg_id)
+            yield _sse({"type": "error", "status": "error", "detail": error.detail})
+            return
+        finally:
+            slot.release()
+        bot_response_text = "".join(parts)
+        await _finish_turn(message, turn, user_msg_id, bot_response_text, llm_service.count_tokens(bot_response_text))
+        yield _sse({
+            "type": "done",
+            "status": "success",
+            "session_id": message.session_id,
+            "bot_content": bot_response_text
+        })
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=_summary_task(turn)
+    )
 
 @router.post("/monitoring/metrics", response_model=dict)
 def add_metric(metric: schemas.MonitoringMetric):
@@ -125,17 +262,36 @@ def add_metric(metric: schemas.MonitoringMetric):
     return {"status": "success", "metric_id": metric_id}
 
 @router.get("/monitoring/metrics", response_model=dict)
-def get_metrics(limit: int = 10):
-    metrics = monitoring_service.get_recent_metrics(limit)
+async def get_metrics(limit: int = 10):
+    metrics = await monitoring_service.get_recent_metrics(limit)
     return {"metrics": metrics}
 
+@router.get("/monitoring/runtime", response_model=dict)
+async def get_runtime_stats():
+    return {
+        **(await llm_service.aget_runtime_stats()),
+        "telemetry": telemetry_sink.stats(),
+        "chat_writer": chat_service.message_writer.stats(),
+        "admission": admission.stats(),
+        "password_hashing": auth_service.hash_stats()
+    }
+
 @router.get("/monitoring/logs", response_model=dict)
-def get_logs(limit: int = 10, current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
-    from src.db.mongo_client import get_db
-    db = get_db()
-    logs = list(db.Logs.find().sort("timestamp", -1).limit(limit))
+async def get_logs(limit: int = 10, current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
+    logs = await logging_service.get_logs(limit)
     return {"logs": logs}
 
 @router.get("/auth/me", response_model=schemas.UserOut)
-def get_current_user_info(current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
+async def get_current_user_info(current_user: schemas.UserOut = Depends(auth_service.get_current_user)):
     return current_user
+
+@router.get("/health/live", response_model=dict)
+async def liveness():
+    return {"status": "ok"}
+
+@router.get("/health/ready", response_model=dict)
+async def readiness(response: Response):
+    state = llm_service.readiness()
+    if state != "ready":
+        response.status_code = 503
+    return {"status": state}
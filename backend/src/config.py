@@ -7,4 +7,62 @@ class Settings(BaseSettings):
     MODEL_MAX_TOKENS: int = 2048
     MODEL_TEMPERATURE: float = 0.7
     HF_TOKEN: str = None
-    MODEL_DEVICE: str = "auto"
\ No newline at end of file
+    MODEL_DEVICE: str = "auto"
+    MODEL_ID: str = "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B"
+    MODEL_BACKEND: str = "fp32"
+    MODEL_ONNX_DIR: str = None
+    MODEL_WARMUP_TOKENS: int = 16
+    MODEL_DRAFT_ID: str = None
+    MODEL_DRAFT_LOOKAHEAD: int = 4
+    MODEL_LOCAL_PATH: str = None
+    MODEL_LOAD_ON_STARTUP: bool = True
+    TORCH_NUM_THREADS: int = 0
+    TORCH_INTEROP_THREADS: int = 0
+    INFERENCE_MODE: str = "local"
+    INFERENCE_SERVER_ADDRESS: str = None
+    INFERENCE_SERVER_AUTHKEY: str = None
+    INFERENCE_SERVER_REPLICAS: int = 1
+    INFERENCE_CLIENT_MAX_INFLIGHT: int = 64
+    SCHEDULER_MAX_BATCH_SIZE: int = 8
+    SCHEDULER_MAX_WAIT_MS: int = 10
+    SCHEDULER_REQUEST_TIMEOUT: float = 120.0
+    PREFIX_CACHE_MAX_ENTRIES: int = 256
+    PREFIX_CACHE_MAX_MB: int = 1024
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_MAX_ENTRIES: int = 4096
+    RESPONSE_CACHE_MAX_MB: int = 64
+    RESPONSE_CACHE_MAX_TEMPERATURE: float = 0.5
+    CONTEXT_MAX_TURNS: int = 32
+    CONTEXT_MAX_TOKENS: int = 1536
+    CONTEXT_MESSAGE_MAX_TOKENS: int = 256
+    CONTEXT_WINDOW_SESSIONS: int = 1024
+    SUMMARY_ENABLED: bool = True
+    SUMMARY_MAX_TOKENS: int = 128
+    SUMMARY_MAX_FOLD_TURNS: int = 32
+    SUMMARY_TRIGGER_RATIO: float = 0.75
+    SUMMARY_KEEP_RATIO: float = 0.4
+    CHAT_PAGE_SIZE: int = 50
+    CHAT_MAX_PAGE_SIZE: int = 200
+    CHAT_PERSISTENCE_MODE: str = "sync"
+    CHAT_WRITE_BEHIND_QUEUE_SIZE: int = 10000
+    CHAT_WRITE_BEHIND_BATCH_SIZE: int = 500
+    CHAT_WRITE_BEHIND_FLUSH_INTERVAL: float = 0.2
+    CHAT_WRITE_BEHIND_RETRY_INTERVAL: float = 0.5
+    DB_ENSURE_INDEXES: bool = True
+    DB_QUERY_PLAN_CHECK: str = "warn"
+    TELEMETRY_QUEUE_SIZE: int = 10000
+    TELEMETRY_BATCH_SIZE: int = 500
+    TELEMETRY_FLUSH_INTERVAL: float = 2.0
+    TELEMETRY_MLFLOW_ENABLED: bool = True
+    MLFLOW_EXPERIMENT_NAME: str = "neurochat"
+    METRICS_SAMPLE_INTERVAL: float = 5.0
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_RATE_PER_MINUTE: float = 20.0
+    ADMISSION_BURST: int = 5
+    ADMISSION_MAX_ACTIVE: int = 16
+    ADMISSION_MAX_QUEUE: int = 64
+    ADMISSION_QUEUE_TIMEOUT: float = 30.0
+    ADMISSION_MAX_USERS: int = 10000
+
+
+settings = Settings()
@@ -0,0 +1,91 @@
+import logging
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from src.config import settings
+from src.db.mongo_client import get_async_db
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "Users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "Sessions": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("start_time", DESCENDING), ("_id", DESCENDING)],
+                   name="user_id_start_time_id"),
+    ],
+    "Messages": [
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+                   name="session_id_timestamp_id"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "Logs": [
+        IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+    ],
+    "MonitoringMetrics": [
+        IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+    ],
+}
+
+HOT_QUERIES = [
+    ("Users", {"username": ""}, None),
+    ("Users", {"email": ""}, None),
+    ("Sessions", {"session_id": ""}, None),
+    ("Sessions", {"user_id": ""}, [("start_time", DESCENDING), ("_id", DESCENDING)]),
+    ("Messages", {"session_id": ""}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ("Logs", {}, [("timestamp", DESCENDING)]),
+    ("MonitoringMetrics", {}, [("timestamp", DESCENDING)]),
+]
+
+
+async def ensure_indexes(db=None):
+    db = db if db is not None else get_async_db()
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            logger.error(f"Index creation failed for {collection}: {str(e)}")
+
+
+def _plan_stages(plan) -> set:
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            stages |= _plan_stages(item)
+    return stages
+
+
+async def check_query_plans(db=None, mode: str = "warn") -> list:
+    db = db if db is not None else get_async_db()
+    collscans = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explain = await cursor.limit(1).explain()
+        except Exception as e:
+            logger.warning(f"Query plan check skipped, explain is not available: {str(e)}")
+            return collscans
+        if "COLLSCAN" in _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})):
+            collscans.append(f"{collection} {query} sort={sort}")
+
+    for description in collscans:
+        logger.warning(f"Hot query plans a COLLSCAN: {description}")
+    if collscans and mode == "fail":
+        raise RuntimeError(f"{len(collscans)} hot queries plan a COLLSCAN")
+    return collscans
+
+
+async def run_startup_migrations():
+    if settings.DB_ENSURE_INDEXES:
+        await ensure_indexes()
+    if settings.DB_QUERY_PLAN_CHECK != "off":
+        await check_query_plans(mode=settings.DB_QUERY_PLAN_CHECK)
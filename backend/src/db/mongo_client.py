@@ -1,12 +1,129 @@
 import os
-from pymongo import MongoClient
+import time
+from threading import Lock, local
+from pymongo import MongoClient, monitoring
 from dotenv import load_dotenv
 
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "llm_chat_db")
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 10000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+
+_client = None
+_async_client = None
+_mock_client = None
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.lock = Lock()
+        self.pending = local()
+        self.counters = {
+            "open": 0, "checked_out": 0, "checkouts": 0, "checkout_failures": 0,
+            "checkout_wait_seconds": 0.0, "checkout_wait_max_seconds": 0.0, "pools_cleared": 0
+        }
+
+    def _add(self, key: str, value=1):
+        with self.lock:
+            self.counters[key] += value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("open", -1)
+
+    def connection_check_out_started(self, event):
+        self.pending.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._add("checkout_failures")
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self.pending, "started", time.perf_counter())
+        with self.lock:
+            self.counters["checked_out"] += 1
+            self.counters["checkouts"] += 1
+            self.counters["checkout_wait_seconds"] += waited
+            self.counters["checkout_wait_max_seconds"] = max(self.counters["checkout_wait_max_seconds"], waited)
+
+    def connection_checked_in(self, event):
+        self._add("checked_out", -1)
+
+
+pool_stats = PoolStats()
+
+
+def _use_mock() -> bool:
+    return MONGO_URI.startswith("mongomock://")
+
+
+def _mock_sync_client():
+    global _mock_client
+    if _mock_client is None:
+        import mongomock
+        _mock_client = mongomock.MongoClient()
+    return _mock_client
+
+
+def client_options() -> dict:
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": [pool_stats],
+    }
+
 
 def get_db():
-    return db
+    global _client
+    if _client is None:
+        _client = _mock_sync_client() if _use_mock() else MongoClient(MONGO_URI, **client_options())
+    return _client[DB_NAME]
+
+
+def get_async_db():
+    global _async_client
+    if _async_client is None:
+        if _use_mock():
+            from mongomock_motor import AsyncMongoMockClient
+            _async_client = AsyncMongoMockClient(mock_mongo_client=_mock_sync_client())
+        else:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            _async_client = AsyncIOMotorClient(MONGO_URI, **client_options())
+    return _async_client[DB_NAME]
+
+
+def close_clients():
+    global _client, _async_client, _mock_client
+    for client in (_client, _async_client):
+        if client is not None and not _use_mock():
+            client.close()
+    _client = _async_client = _mock_client = None
@@ -0,0 +1,141 @@
+import logging
+import os
+import signal
+import stat
+import tempfile
+from multiprocessing.connection import Listener, Connection
+from threading import Thread
+from typing import List
+
+from src.config import settings
+from src.monitoring.prometheus_metrics import capture_observations
+
+logger = logging.getLogger(__name__)
+
+
+def authkey() -> bytes:
+    if not settings.INFERENCE_SERVER_AUTHKEY:
+        raise RuntimeError("INFERENCE_SERVER_AUTHKEY must be set")
+    return settings.INFERENCE_SERVER_AUTHKEY.encode()
+
+
+def _private_dir() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        path = os.path.join(runtime_dir, "neurochat")
+    else:
+        path = os.path.join(tempfile.gettempdir(), f"neurochat-{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{path} must be a directory owned by uid {os.getuid()} with mode 0700")
+    return path
+
+
+def replica_addresses() -> List[str]:
+    address = settings.INFERENCE_SERVER_ADDRESS or os.path.join(_private_dir(), "inference.sock")
+    if settings.INFERENCE_SERVER_REPLICAS <= 1:
+        return [address]
+    return [f"{address}.{i}" for i in range(settings.INFERENCE_SERVER_REPLICAS)]
+
+
+def _handle(conn: Connection, processor):
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            op = request.get("op")
+            with capture_observations() as observations:
+                try:
+                    if op == "generate":
+                        result = processor.generate_response(request["messages"], request.get("use_cache", True))
+                    elif op == "stream":
+                        stream = processor.stream_response(request["messages"], request.get("use_cache", True))
+                        try:
+                            for delta in stream:
+                                conn.send(("token", delta, ()))
+                        finally:
+                            stream.close()
+                        result = None
+                    elif op == "summarize":
+                        result = processor.summarize(request["summary"], request["turns"])
+                    elif op == "stats":
+                        result = processor.runtime_stats()
+                    else:
+                        conn.send(("error", f"Unknown op {op!r}", ()))
+                        continue
+                except (OSError, EOFError):
+                    raise
+                except Exception as e:
+                    logger.error(f"Inference {op} error: {str(e)}")
+                    conn.send(("error", str(e), ()))
+                    continue
+            conn.send(("end" if op == "stream" else "result", result, observations))
+    except (OSError, EOFError):
+        pass
+    except Exception as e:
+        logger.error(f"Inference connection error: {str(e)}")
+    finally:
+        conn.close()
+
+
+def _serve(processor, address: str):
+    if os.path.exists(address):
+        os.unlink(address)
+    with Listener(address, family="AF_UNIX", authkey=authkey()) as listener:
+        os.chmod(address, 0o600)
+        logger.info(f"Inference server listening on {address} (pid {os.getpid()})")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logger.warning(f"Rejected inference connection: {str(e)}")
+                continue
+            Thread(target=_handle, args=(conn, processor), daemon=True).start()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    try:
+        authkey()
+        addresses = replica_addresses()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    from src.services.llm_engine import NeuroChatProcessor
+    from src.services.llm_backends import configure_threads
+
+    processor = NeuroChatProcessor(start=False)
+    if not processor.model:
+        raise SystemExit("Model not loaded")
+
+    if len(addresses) == 1:
+        processor.start()
+        _serve(processor, addresses[0])
+        return
+
+    children = []
+    for address in addresses:
+        pid = os.fork()
+        if pid == 0:
+            configure_threads(settings.TORCH_NUM_THREADS, settings.TORCH_INTEROP_THREADS)
+            processor.start()
+            _serve(processor, address)
+            os._exit(0)
+        children.append(pid)
+
+    def terminate(signum, frame):
+        for child in children:
+            os.kill(child, signal.SIGTERM)
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for _ in children:
+        os.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.api.routes import router as api_router
+from src.db.migrations import run_startup_migrations
+from src import inference_server
+from src.config import settings
+from src.services import chat_service, llm_service
+from src.services.auth_service import shutdown_hash_pool
+from src.services.telemetry import telemetry_sink
 from src.monitoring.prometheus_metrics import (
-    prometheus_middleware, 
+    PrometheusMiddleware,
     metrics_endpoint, 
-    start_mongodb_monitoring_thread
+    start_mongodb_monitoring_thread,
+    stop_mongodb_monitoring_thread
 )
 
 app = FastAPI(title="NeuroChat Backend with Monitoring")
@@ -21,15 +28,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.middleware("http")(prometheus_middleware)
+app.add_middleware(PrometheusMiddleware)
 app.include_router(api_router, prefix="/api")
 
 app.add_api_route("/metrics", metrics_endpoint)
 
 @app.on_event("startup")
 async def startup_event():
+    if settings.INFERENCE_MODE == "remote":
+        inference_server.authkey()
+    await run_startup_migrations()
+    telemetry_sink.start()
+    chat_service.message_writer.start()
+    if settings.MODEL_LOAD_ON_STARTUP:
+        llm_service.ensure_loaded()
     start_mongodb_monitoring_thread()
 
+@app.on_event("shutdown")
+def shutdown_event():
+    stop_mongodb_monitoring_thread()
+    chat_service.message_writer.stop()
+    telemetry_sink.stop()
+    shutdown_hash_pool()
+    llm_service.shutdown()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("src.main:app", host="0.0.0.0", port=8000, reload=True)
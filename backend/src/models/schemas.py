@@ -30,6 +30,7 @@ class Message(BaseModel):
     role: str = Field(..., example="user")
     content: str = Field(..., example="Привет, расскажи о MongoDB?")
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+    use_cache: bool = Field(True, example=True)
 
 class Session(BaseModel):
     session_id: Optional[str] = Field(None, example="sess_67890")
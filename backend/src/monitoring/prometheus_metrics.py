@@ -0,0 +1,230 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Event, Thread
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HTTP_REQUEST_LATENCY = Histogram(
+    "neurochat_http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "neurochat_http_requests_in_progress", "HTTP requests currently being handled", ["method"]
+)
+CHAT_STAGE_LATENCY = Histogram(
+    "neurochat_chat_stage_duration_seconds", "Time spent in each stage of the chat pipeline",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+LLM_QUEUE_WAIT = Histogram(
+    "neurochat_llm_queue_wait_seconds", "Time generation requests wait for the scheduler", buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS_GENERATED = Counter("neurochat_llm_generated_tokens", "Tokens generated by the model")
+LLM_TOKENS_PER_SECOND = Histogram(
+    "neurochat_llm_decode_tokens_per_second", "Per-request decode throughput",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+LLM_STOPS = Counter("neurochat_llm_generation_stops", "Finished generation requests by stop reason", ["reason"])
+LLM_TOKENS_SAVED = Counter(
+    "neurochat_llm_early_stop_saved_tokens", "Decode steps below max_new_tokens skipped by early stopping", ["reason"]
+)
+LLM_SCHEDULER = Gauge("neurochat_llm_scheduler", "LLM scheduler queue and batch sizes", ["stat"])
+ADMISSION = Gauge("neurochat_admission", "Chat requests holding or waiting for an LLM slot", ["stat"])
+ADMISSION_WAIT = Histogram(
+    "neurochat_admission_wait_seconds", "Time admitted chat requests waited for an LLM slot", buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter("neurochat_admission_rejected", "Chat requests rejected by admission control", ["reason"])
+MONGO_POOL = Gauge("neurochat_mongo_pool", "MongoDB client connection pool statistics", ["stat"])
+MONGO_SERVER_CONNECTIONS = Gauge("neurochat_mongo_server_connections", "MongoDB server connection counts", ["state"])
+TELEMETRY_SINK = Gauge("neurochat_telemetry_sink", "Telemetry sink counters and queue size", ["stat"])
+
+_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+_captured: ContextVar[Optional[list]] = ContextVar("captured_observations", default=None)
+_sampler: Optional[Thread] = None
+_sampler_stopped = Event()
+
+
+class RequestTrace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+def current_trace() -> RequestTrace:
+    trace = _trace.get()
+    if trace is None:
+        trace = RequestTrace()
+        _trace.set(trace)
+    return trace
+
+
+@contextmanager
+def capture_observations():
+    observations = []
+    token = _captured.set(observations)
+    try:
+        yield observations
+    finally:
+        _captured.reset(token)
+
+
+def replay_observations(observations):
+    for kind, value in observations:
+        if kind == "stage":
+            observe_stage(*value)
+        elif kind == "generation":
+            observe_generation(value)
+
+
+def observe_stage(name: str, seconds: float):
+    captured = _captured.get()
+    if captured is not None:
+        captured.append(("stage", (name, seconds)))
+        return
+    CHAT_STAGE_LATENCY.labels(name).observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.spans[name] = trace.spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+def observe_generation(timings: dict):
+    captured = _captured.get()
+    if captured is not None:
+        captured.append(("generation", timings))
+        return
+    observe_stage("queue_wait", timings["queue_wait"])
+    observe_stage("prefill", timings["prefill"])
+    observe_stage("decode", timings["decode"])
+    LLM_QUEUE_WAIT.observe(timings["queue_wait"])
+    LLM_TOKENS_GENERATED.inc(timings["tokens"])
+    if timings.get("stop_reason"):
+        LLM_STOPS.labels(timings["stop_reason"]).inc()
+        if timings["tokens_saved"]:
+            LLM_TOKENS_SAVED.labels(timings["stop_reason"]).inc(timings["tokens_saved"])
+    if timings["tokens"] > 1 and timings["decode"] > 0:
+        LLM_TOKENS_PER_SECOND.observe((timings["tokens"] - 1) / timings["decode"])
+
+
+def _route_path(request: Request) -> str:
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class PrometheusMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        trace = RequestTrace()
+        token = _trace.set(trace)
+        HTTP_REQUESTS_IN_PROGRESS.labels(request.method).inc()
+        status, finished = 500, False
+
+        def finish():
+            nonlocal finished
+            if not finished:
+                finished = True
+                HTTP_REQUESTS_IN_PROGRESS.labels(request.method).dec()
+                HTTP_REQUEST_LATENCY.labels(request.method, _route_path(request), str(status)).observe(trace.elapsed())
+
+        async def send_and_observe(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_and_observe)
+        finally:
+            finish()
+            _trace.reset(token)
+
+
+def metrics_endpoint():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def _sample_mongodb(server_status: bool) -> bool:
+    from src.db.mongo_client import get_db, pool_stats
+    for key, value in pool_stats.snapshot().items():
+        MONGO_POOL.labels(key).set(value)
+    if not server_status:
+        return False
+    try:
+        connections = get_db().command("serverStatus").get("connections", {})
+    except Exception as e:
+        logger.warning(f"MongoDB serverStatus sampling disabled: {str(e)}")
+        return False
+    for state in ("current", "available", "active"):
+        if state in connections:
+            MONGO_SERVER_CONNECTIONS.labels(state).set(connections[state])
+    return True
+
+
+def _sample_runtime():
+    from src.services import llm_service
+    from src.services.telemetry import telemetry_sink
+    for key, value in (llm_service.get_scheduler_stats() or {}).items():
+        LLM_SCHEDULER.labels(key).set(value)
+    for key, value in telemetry_sink.stats().items():
+        TELEMETRY_SINK.labels(key).set(value)
+
+
+def _run_sampler(interval: float):
+    server_status = True
+    while not _sampler_stopped.is_set():
+        try:
+            server_status = _sample_mongodb(server_status)
+            _sample_runtime()
+        except Exception as e:
+            logger.error(f"Metrics sampling failed: {str(e)}")
+        _sampler_stopped.wait(interval)
+
+
+def start_mongodb_monitoring_thread(interval: float = None):
+    global _sampler
+    if _sampler is not None and _sampler.is_alive():
+        return _sampler
+    _sampler_stopped.clear()
+    _sampler = Thread(
+        target=_run_sampler, args=(interval or settings.METRICS_SAMPLE_INTERVAL,),
+        name="metrics-sampler", daemon=True
+    )
+    _sampler.start()
+    return _sampler
+
+
+def stop_mongodb_monitoring_thread():
+    _sampler_stopped.set()
@@ -0,0 +1,163 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from src.config import settings
+from src.monitoring.prometheus_metrics import ADMISSION, ADMISSION_REJECTED, ADMISSION_WAIT
+
+RATE_LIMITED = "rate_limited"
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class AdmissionSlot:
+    def __init__(self, controller: Optional["AdmissionController"] = None):
+        self.controller = controller
+        self.started = time.monotonic()
+
+    def release(self):
+        if self.controller is None:
+            return
+        controller, self.controller = self.controller, None
+        controller.release(time.monotonic() - self.started)
+
+
+class AdmissionController:
+    def __init__(self, rate_per_minute: float, burst: int, max_active: int, max_queue: int,
+                 queue_timeout: float, max_users: int):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_users = max_users
+        self.buckets = OrderedDict()
+        self.waiting: Dict[str, deque] = OrderedDict()
+        self.active = 0
+        self.queued = 0
+        self.service_time = 1.0
+        self.counters = {"admitted": 0, RATE_LIMITED: 0, QUEUE_FULL: 0, QUEUE_TIMEOUT: 0}
+
+    def _reject(self, reason: str, retry_after: float):
+        self.counters[reason] += 1
+        ADMISSION_REJECTED.labels(reason).inc()
+        raise AdmissionRejected(reason, retry_after)
+
+    def _publish(self):
+        ADMISSION.labels("active").set(self.active)
+        ADMISSION.labels("queued").set(self.queued)
+
+    def _check_rate(self, user: str, now: float):
+        if self.rate <= 0:
+            return
+        bucket = self.buckets.get(user)
+        if bucket is None:
+            bucket = self.buckets[user] = TokenBucket(self.burst, now)
+            while len(self.buckets) > self.max_users:
+                self.buckets.popitem(last=False)
+        self.buckets.move_to_end(user)
+        retry_after = bucket.take(self.rate, self.burst, now)
+        if retry_after:
+            self._reject(RATE_LIMITED, retry_after)
+
+    def _queue_retry_after(self) -> float:
+        return (self.queued / self.max_active + 1) * self.service_time
+
+    def _discard(self, user: str, future: asyncio.Future):
+        waiters = self.waiting.get(user)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self.waiting[user]
+
+    async def acquire(self, user: str) -> AdmissionSlot:
+        started = time.monotonic()
+        self._check_rate(user, started)
+        if self.active < self.max_active and not self.queued:
+            self.active += 1
+        else:
+            if self.queued >= self.max_queue:
+                self._reject(QUEUE_FULL, self._queue_retry_after())
+            future = asyncio.get_running_loop().create_future()
+            self.waiting.setdefault(user, deque()).append(future)
+            self.queued += 1
+            self._publish()
+            try:
+                await asyncio.wait_for(future, self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._discard(user, future)
+                self._publish()
+                self._reject(QUEUE_TIMEOUT, self._queue_retry_after())
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    self._discard(user, future)
+                    self._publish()
+                else:
+                    self.release(0.0)
+                raise
+        waited = time.monotonic() - started
+        self.counters["admitted"] += 1
+        ADMISSION_WAIT.observe(waited)
+        self._publish()
+        return AdmissionSlot(self)
+
+    def release(self, service_time: float):
+        if service_time:
+            self.service_time = 0.8 * self.service_time + 0.2 * service_time
+        while self.waiting:
+            user, waiters = next(iter(self.waiting.items()))
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self.waiting.move_to_end(user)
+            else:
+                del self.waiting[user]
+            if not future.done():
+                future.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "waiting_users": len(self.waiting),
+            "service_time": self.service_time,
+            **self.counters
+        }
+
+
+admission = AdmissionController(
+    rate_per_minute=settings.ADMISSION_RATE_PER_MINUTE,
+    burst=settings.ADMISSION_BURST,
+    max_active=settings.ADMISSION_MAX_ACTIVE,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    max_users=settings.ADMISSION_MAX_USERS
+)
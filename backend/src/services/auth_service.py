@@ -1,24 +1,116 @@
+import asyncio
 import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 from datetime import datetime, timedelta
 from typing import Optional
-from passlib.context import CryptContext
 import jwt
 from fastapi import HTTPException, status, Depends, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from src.db.mongo_client import get_db
+from pymongo.errors import DuplicateKeyError
+from src.db.mongo_client import get_async_db
 from src.models import schemas
+from src.monitoring.prometheus_metrics import stage
+from src.services import password_hashing
 
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your_secret_key_here")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+AUTH_PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", 10000))
+AUTH_PRINCIPAL_CACHE_TTL = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", 60))
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", 2))
+AUTH_HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", 64))
 security = HTTPBearer()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+class PrincipalCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.revoked = {}
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    def get(self, username: str) -> Optional[schemas.UserOut]:
+        entry = self.entries.get(username)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self.entries[username]
+            return None
+        self.entries.move_to_end(username)
+        return user
+
+    def put(self, username: str, user: schemas.UserOut):
+        self.entries[username] = (time.monotonic() + self.ttl, user)
+        self.entries.move_to_end(username)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        self.entries.pop(username, None)
+        self.revoked[username] = time.time()
+
+    def is_revoked(self, username: str, issued_at: Optional[float]) -> bool:
+        now = time.time()
+        for name, revoked_at in list(self.revoked.items()):
+            if revoked_at < now - ACCESS_TOKEN_EXPIRE_MINUTES * 60:
+                del self.revoked[name]
+        revoked_at = self.revoked.get(username)
+        return revoked_at is not None and (issued_at is None or issued_at <= revoked_at)
+
+principal_cache = PrincipalCache(AUTH_PRINCIPAL_CACHE_SIZE, AUTH_PRINCIPAL_CACHE_TTL)
+
+def invalidate_principal(username: str):
+    principal_cache.invalidate(username)
+
+_hash_pool = None
+_hash_stats = {"pending": 0, "completed": 0, "rejected": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=AUTH_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _hash_pool
+
+async def _run_hash_job(fn, *args):
+    if _hash_stats["pending"] >= AUTH_HASH_MAX_PENDING:
+        _hash_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервис авторизации перегружен, повторите попытку позже",
+            headers={"Retry-After": "1"}
+        )
+    _hash_stats["pending"] += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), fn, *args)
+    finally:
+        elapsed = time.perf_counter() - started
+        _hash_stats["pending"] -= 1
+        _hash_stats["completed"] += 1
+        _hash_stats["total_seconds"] += elapsed
+        _hash_stats["max_seconds"] = max(_hash_stats["max_seconds"], elapsed)
+
+def hash_stats() -> dict:
+    completed = _hash_stats["completed"]
+    return {
+        **_hash_stats,
+        "workers": AUTH_HASH_WORKERS,
+        "rounds": password_hashing.AUTH_BCRYPT_ROUNDS,
+        "avg_seconds": _hash_stats["total_seconds"] / completed if completed else 0.0
+    }
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -26,35 +118,58 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
-def register_user(user: schemas.UserCreate):
-    db = get_db()
-    if db.Users.find_one({"username": user.username}) or db.Users.find_one({"email": user.email}):
-        raise HTTPException(status_code=400, detail="Пользователь с таким именем или email уже существует")
-    hashed_password = get_password_hash(user.password)
+def principal_claims(user_doc: dict) -> dict:
+    return {
+        "sub": user_doc["username"],
+        "email": user_doc["email"],
+        "created_at": str(user_doc["created_at"])
+    }
+
+def _user_exists() -> HTTPException:
+    return HTTPException(status_code=400, detail="Пользователь с таким именем или email уже существует")
+
+async def register_user(user: schemas.UserCreate):
+    db = get_async_db()
+    if await db.Users.find_one({"username": user.username}) or await db.Users.find_one({"email": user.email}):
+        raise _user_exists()
+    hashed_password = await _run_hash_job(password_hashing.get_password_hash, user.password)
     user_doc = {
         "username": user.username,
         "email": user.email,
         "hashed_password": hashed_password,
         "created_at": datetime.utcnow().isoformat() + "Z"
     }
-    db.Users.insert_one(user_doc)
+    try:
+        await db.Users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise _user_exists()
     return schemas.UserOut(username=user.username, email=user.email, created_at=datetime.utcnow())
 
-def authenticate_user(username: str, password: str):
-    db = get_db()
-    user_doc = db.Users.find_one({"username": username})
+async def authenticate_user(username: str, password: str):
+    db = get_async_db()
+    user_doc = await db.Users.find_one({"username": username})
     if not user_doc:
         return False
-    if not verify_password(password, user_doc["hashed_password"]):
+    verified, new_hash = await _run_hash_job(
+        password_hashing.verify_and_update, password, user_doc["hashed_password"]
+    )
+    if not verified:
         return False
+    if new_hash:
+        await db.Users.update_one({"username": username}, {"$set": {"hashed_password": new_hash}})
+        user_doc["hashed_password"] = new_hash
     return user_doc
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    with stage("auth"):
+        return await _resolve_principal(credentials.credentials)
+
+
+async def _resolve_principal(token: str) -> schemas.UserOut:
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
         username: str = payload.get("sub")
@@ -62,8 +177,17 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Недействительный токен")
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Недействительный токен")
-    db = get_db()
-    user_doc = db.Users.find_one({"username": username})
+    if AUTH_TRUST_TOKEN_CLAIMS and "email" in payload and "created_at" in payload:
+        if principal_cache.is_revoked(username, payload.get("iat")):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Недействительный токен")
+        return schemas.UserOut(username=username, email=payload["email"], created_at=payload["created_at"])
+    user = principal_cache.get(username)
+    if user is not None:
+        return user
+    db = get_async_db()
+    user_doc = await db.Users.find_one({"username": username})
     if user_doc is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return schemas.UserOut(username=user_doc["username"], email=user_doc["email"], created_at=user_doc["created_at"])
+    user = schemas.UserOut(username=user_doc["username"], email=user_doc["email"], created_at=user_doc["created_at"])
+    principal_cache.put(username, user)
+    return user
@@ -1,11 +1,93 @@
-import time
+import base64
+import json
 from datetime import datetime
 from uuid import uuid4
+from collections import OrderedDict, deque
 from bson import ObjectId
-from typing import List, Dict
-from src.db.mongo_client import get_db
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+from typing import List, Dict, Callable, Optional, Tuple, Awaitable
+from src.config import settings
+from src.db.mongo_client import get_async_db
+from src.services.message_writer import MessageWriter
 
-db = get_db()
+class ContextWindow(deque):
+    last_message_at: Optional[str] = None
+
+class ContextWindows:
+    def __init__(self, max_sessions: int, max_turns: int):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.windows = OrderedDict()
+
+    def get(self, session_id: str) -> Optional[ContextWindow]:
+        window = self.windows.get(session_id)
+        if window is not None:
+            self.windows.move_to_end(session_id)
+        return window
+
+    def put(self, session_id: str, turns: List[Dict], last_message_at: Optional[str] = None) -> ContextWindow:
+        window = ContextWindow(turns, maxlen=self.max_turns)
+        window.last_message_at = last_message_at
+        self.windows[session_id] = window
+        self.windows.move_to_end(session_id)
+        while len(self.windows) > self.max_sessions:
+            self.windows.popitem(last=False)
+        return window
+
+    def extend(self, session_id: str, turns: List[Dict], last_message_at: Optional[str] = None):
+        window = self.windows.get(session_id)
+        if window is not None:
+            window.extend(turns)
+            if last_message_at:
+                window.last_message_at = last_message_at
+
+    def advance(self, session_id: str, seen: Optional[str], last_message_at: str):
+        window = self.windows.get(session_id)
+        if window is not None and window.last_message_at == seen:
+            window.last_message_at = last_message_at
+
+    def drop(self, session_id: str):
+        self.windows.pop(session_id, None)
+
+context_windows = ContextWindows(settings.CONTEXT_WINDOW_SESSIONS, settings.CONTEXT_MAX_TURNS)
+
+message_writer = MessageWriter(
+    max_queue=settings.CHAT_WRITE_BEHIND_QUEUE_SIZE,
+    batch_size=settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL,
+    retry_interval=settings.CHAT_WRITE_BEHIND_RETRY_INTERVAL,
+    on_advanced=context_windows.advance
+)
+
+_summarizing = set()
+
+def new_message_id() -> str:
+    return f"msg_{ObjectId()}"
+
+def _window_turn(message: Dict) -> Dict:
+    return {"role": message["role"], "content": str(message["content"]), "timestamp": message.get("timestamp", "")}
+
+class ChatTurn:
+    def __init__(self, session_id: str, title: Optional[str] = None, summary: Optional[Dict] = None):
+        self.session_id = session_id
+        self.title = title
+        self.summary = summary
+        self.messages = []
+        self.turns = []
+
+    def add_message(self, role: str, user_id: str, content: str) -> str:
+        message = {
+            "session_id": self.session_id,
+            "user_id": user_id,
+            "role": role,
+            "content": content,
+            "message_id": new_message_id(),
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+        self.messages.append(message)
+        self.turns.append(_window_turn(message))
+        return message["message_id"]
 
 def convert_objectid(data):
     if isinstance(data, dict):
@@ -17,47 +99,238 @@ def convert_objectid(data):
     else:
         return data
 
-def create_session(session_data: dict) -> str:
+async def create_session(session_data: dict) -> str:
     session_data["session_id"] = f"sess_{uuid4().hex}"
     session_data["start_time"] = datetime.utcnow().isoformat() + "Z"
     session_data.setdefault("metadata", {})
-    db.Sessions.insert_one(session_data)
+    await get_async_db().Sessions.insert_one(session_data)
     return session_data["session_id"]
 
-def save_message(message: dict) -> str:
-    message["message_id"] = f"msg_{int(time.time() * 1000)}"
-    message["timestamp"] = datetime.utcnow().isoformat() + "Z"
-    db.Messages.insert_one(message)
-    return message["message_id"]
-
-def get_session_messages(session_id: str):
-    messages = list(db.Messages.find({"session_id": session_id}).sort("timestamp", 1))
-    return convert_objectid(messages)
-
-def get_chat_context(session_id: str) -> list:
-    messages = get_session_messages(session_id)
-    messages = messages[-6:]
-    validated_messages = []
-    for msg in messages:
-        if not isinstance(msg, dict):
-            continue
-        if "role" not in msg or "content" not in msg:
-            continue
-        validated_messages.append({
-            "role": msg["role"],
-            "content": str(msg["content"])[:500]
-        })
-    return validated_messages
+async def begin_turn(session_id: str, title: Optional[str] = None, new_session: bool = False,
+                     summary: Optional[Dict] = None, last_message_at: Optional[str] = None) -> ChatTurn:
+    if new_session:
+        context_windows.put(session_id, [])
+    else:
+        window = context_windows.get(session_id)
+        if window is None or window.last_message_at != last_message_at:
+            await _load_context_window(session_id, last_message_at)
+    return ChatTurn(session_id, title, summary)
+
+async def persist_turn(turn: ChatTurn):
+    db = get_async_db()
+    window = context_windows.get(turn.session_id)
+    seen = window.last_message_at if window is not None else None
+    last_message_at = None
+    if settings.CHAT_PERSISTENCE_MODE != "write_behind" or \
+            not message_writer.enqueue_turn(turn.session_id, turn.messages, seen):
+        await db.Messages.insert_many(turn.messages, ordered=True)
+        if not message_writer.enqueue_turn(turn.session_id, turn.messages, seen, stored=True) and \
+                not message_writer.has_queued(turn.session_id):
+            last_message_at = turn.messages[-1]["timestamp"]
+            await db.Sessions.update_one(
+                {"session_id": turn.session_id}, {"$max": {"last_message_at": last_message_at}}
+            )
+    if turn.title:
+        await db.Sessions.update_one({"session_id": turn.session_id}, {"$set": {"metadata.title": turn.title}})
+    context_windows.extend(turn.session_id, turn.turns, last_message_at)
+
+MESSAGE_FIELDS = {"_id": 1, "message_id": 1, "role": 1, "content": 1, "timestamp": 1}
+SESSION_FIELDS = {"_id": 1, "session_id": 1, "metadata.title": 1, "start_time": 1}
+
+def encode_cursor(key: str, oid: ObjectId) -> str:
+    return base64.urlsafe_b64encode(json.dumps([key, str(oid)]).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[str, ObjectId]:
+    try:
+        key, oid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(key), ObjectId(oid)
+    except (ValueError, TypeError, InvalidId):
+        raise ValueError("Invalid cursor")
+
+def _keyset_query(query: dict, field: str, cursor: Optional[str]) -> dict:
+    if not cursor:
+        return query
+    key, oid = decode_cursor(cursor)
+    return {**query, "$or": [{field: {"$lt": key}}, {field: key, "_id": {"$lt": oid}}]}
+
+async def _keyset_page(collection, query: dict, projection: dict, field: str,
+                       limit: int, cursor: Optional[str]) -> Tuple[List[Dict], Optional[str]]:
+    docs = await collection.find(_keyset_query(query, field, cursor), projection) \
+        .sort([(field, DESCENDING), ("_id", DESCENDING)]) \
+        .limit(limit + 1) \
+        .to_list(length=limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1][field], docs[-1]["_id"])
+    for doc in docs:
+        doc.pop("_id")
+    return docs, next_cursor
+
+async def get_session_messages(session_id: str, limit: int,
+                               cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    messages, next_cursor = await _keyset_page(
+        get_async_db().Messages, {"session_id": session_id}, MESSAGE_FIELDS, "timestamp", limit, cursor
+    )
+    messages.reverse()
+    return messages, next_cursor
 
-def get_session(session_id: str):
-    session = db.Sessions.find_one({"session_id": session_id})
+def _truncate_chars(text: str, max_tokens: int) -> Tuple[str, int]:
+    text = text[:max_tokens * 4]
+    return text, len(text) // 4 + 1
+
+async def _recent_turns(session_id: str) -> List[Dict]:
+    cursor = get_async_db().Messages.find(
+        {"session_id": session_id},
+        {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+    ).sort("timestamp", -1).limit(settings.CONTEXT_MAX_TURNS)
+    messages = await cursor.to_list(length=settings.CONTEXT_MAX_TURNS)
+    return [_window_turn(msg) for msg in reversed(messages) if "role" in msg and "content" in msg]
+
+async def _load_context_window(session_id: str, last_message_at: Optional[str] = None) -> ContextWindow:
+    queued = message_writer.queued(session_id)
+    turns = await _recent_turns(session_id)
+    stored = {turn["timestamp"] for turn in turns}
+    turns += [_window_turn(message) for message in queued if message["timestamp"] not in stored]
+    return context_windows.put(session_id, turns[-settings.CONTEXT_MAX_TURNS:], last_message_at)
+
+def _turn_tokens(turn: Dict, truncate: Callable[[str, int], Tuple[str, int]]) -> int:
+    if "tokens" not in turn:
+        turn["truncated"], turn["tokens"] = truncate(turn["content"], settings.CONTEXT_MESSAGE_MAX_TOKENS)
+    return turn["tokens"]
+
+def _unsummarized(turns, summary_until: Optional[str]) -> List[Dict]:
+    return [turn for turn in turns if not summary_until or turn.get("timestamp", "") > summary_until]
+
+def _summary_budget(summary: Optional[Dict]) -> int:
+    return settings.CONTEXT_MAX_TOKENS - (settings.SUMMARY_MAX_TOKENS if (summary or {}).get("text") else 0)
+
+def _select_turns(turns, truncate: Callable[[str, int], Tuple[str, int]], budget: int,
+                  summary_until: Optional[str] = None) -> List[Dict]:
+    selected = []
+    for turn in reversed(turns):
+        if summary_until and turn.get("timestamp", "") <= summary_until:
+            break
+        _turn_tokens(turn, truncate)
+        if selected and turn["tokens"] > budget:
+            break
+        budget -= turn["tokens"]
+        selected.append(turn)
+    selected.reverse()
+    return selected
+
+def _trim_window(window: ContextWindow, pending: List[Dict], truncate: Callable[[str, int], Tuple[str, int]],
+                 budget: int, summary_until: Optional[str]):
+    while window and summary_until and window[0].get("timestamp", "") <= summary_until:
+        window.popleft()
+    if settings.SUMMARY_ENABLED:
+        return
+    budget -= sum(_turn_tokens(turn, truncate) for turn in pending)
+    if len(window) + len(pending) < settings.CONTEXT_MAX_TURNS and \
+            sum(_turn_tokens(turn, truncate) for turn in window) <= budget:
+        return
+    for _ in range(len(window) - len(_kept_turns(list(window), truncate, budget))):
+        window.popleft()
+
+async def get_chat_context(session_id: str,
+                           truncate: Callable[[str, int], Tuple[str, int]] = None,
+                           summary: Optional[Dict] = None, pending: List[Dict] = ()) -> list:
+    truncate = truncate or _truncate_chars
+    window = context_windows.get(session_id)
+    if window is None:
+        window = await _load_context_window(session_id)
+
+    context, budget, summary_until = [], settings.CONTEXT_MAX_TOKENS, None
+    if summary and summary.get("text"):
+        text, tokens = truncate(summary["text"], settings.SUMMARY_MAX_TOKENS)
+        context.append({"role": "system", "content": f"Summary of the earlier conversation: {text}"})
+        budget -= tokens
+        summary_until = summary.get("until")
+    _trim_window(window, pending, truncate, budget, summary_until)
+    for turn in _select_turns([*window, *pending], truncate, budget, summary_until):
+        context.append({"role": turn["role"], "content": turn["truncated"]})
+    return context
+
+def _over_budget(turns: List[Dict], truncate: Callable[[str, int], Tuple[str, int]], budget: int) -> bool:
+    ratio = settings.SUMMARY_TRIGGER_RATIO
+    return len(turns) >= settings.CONTEXT_MAX_TURNS * ratio or \
+        sum(_turn_tokens(turn, truncate) for turn in turns) > budget * ratio
+
+def needs_summary(session_id: str, summary: Optional[Dict] = None,
+                  truncate: Callable[[str, int], Tuple[str, int]] = None) -> bool:
+    window = context_windows.get(session_id)
+    if not window:
+        return False
+    return _over_budget(
+        _unsummarized(window, (summary or {}).get("until")), truncate or _truncate_chars, _summary_budget(summary)
+    )
+
+def _kept_turns(turns: List[Dict], truncate: Callable[[str, int], Tuple[str, int]], budget: int) -> List[Dict]:
+    max_turns = max(1, int(settings.CONTEXT_MAX_TURNS * settings.SUMMARY_KEEP_RATIO))
+    budget = int(budget * settings.SUMMARY_KEEP_RATIO)
+    kept = []
+    for turn in reversed(turns):
+        if kept and (len(kept) >= max_turns or _turn_tokens(turn, truncate) > budget):
+            break
+        budget -= _turn_tokens(turn, truncate)
+        kept.append(turn)
+    kept.reverse()
+    return kept
+
+async def update_summary(session_id: str,
+                         summarize: Callable[[str, List[Dict]], Awaitable[Optional[str]]],
+                         truncate: Callable[[str, int], Tuple[str, int]] = None):
+    if session_id in _summarizing:
+        return
+    _summarizing.add(session_id)
+    try:
+        truncate = truncate or _truncate_chars
+        db = get_async_db()
+        session = await db.Sessions.find_one({"session_id": session_id}, {"_id": 0, "summary": 1})
+        if session is None:
+            return
+        previous = session.get("summary") or {}
+        pending = _unsummarized(await _recent_turns(session_id), previous.get("until"))
+        budget = _summary_budget(previous)
+        if not _over_budget(pending, truncate, budget):
+            return
+        kept = _kept_turns(pending, truncate, budget)
+
+        query = {"session_id": session_id, "timestamp": {"$lt": kept[0]["timestamp"]}}
+        if previous.get("until"):
+            query["timestamp"]["$gt"] = previous["until"]
+        folded = await db.Messages.find(query, {"_id": 0, "role": 1, "content": 1, "timestamp": 1}) \
+            .sort("timestamp", 1) \
+            .limit(settings.SUMMARY_MAX_FOLD_TURNS) \
+            .to_list(length=settings.SUMMARY_MAX_FOLD_TURNS)
+        if not folded:
+            return
+
+        turns = [
+            {"role": msg["role"], "content": truncate(str(msg["content"]), settings.CONTEXT_MESSAGE_MAX_TOKENS)[0]}
+            for msg in folded
+        ]
+        text = await summarize(previous.get("text", ""), turns)
+        if not text:
+            return
+        await db.Sessions.update_one(
+            {"session_id": session_id, "summary.until": previous.get("until")},
+            {"$set": {"summary": {"text": text, "until": folded[-1]["timestamp"]}}}
+        )
+    finally:
+        _summarizing.discard(session_id)
+
+async def get_session(session_id: str):
+    session = await get_async_db().Sessions.find_one({"session_id": session_id})
     if session:
         return convert_objectid(session)
     return session
 
-def list_sessions(username: str):
-    sessions = list(db.Sessions.find({"user_id": username}))
-    sessions = convert_objectid(sessions)
+async def list_sessions(username: str, limit: int,
+                        cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    sessions, next_cursor = await _keyset_page(
+        get_async_db().Sessions, {"user_id": username}, SESSION_FIELDS, "start_time", limit, cursor
+    )
     transformed = []
     for sess in sessions:
         title = sess.get("metadata", {}).get("title", sess.get("session_id"))
@@ -66,20 +339,14 @@ def list_sessions(username: str):
             "title": title,
             "start_time": sess.get("start_time")
         })
-    return transformed
-
-def update_session_title(session_id: str, title: str):
-    db.Sessions.update_one(
-        {"session_id": session_id},
-        {"$set": {"metadata.title": title}},
-        upsert=True
-    )
+    return transformed, next_cursor
 
-def delete_session(session_id: str) -> int:
-    result = db.Sessions.delete_one({"session_id": session_id})
+async def delete_session(session_id: str) -> int:
+    result = await get_async_db().Sessions.delete_one({"session_id": session_id})
     return result.deleted_count
 
-def delete_session_messages(session_id: str) -> int:
-    result = db.Messages.delete_many({"session_id": session_id})
+async def delete_session_messages(session_id: str) -> int:
+    context_windows.drop(session_id)
+    result = await get_async_db().Messages.delete_many({"session_id": session_id})
     return result.deleted_count
 
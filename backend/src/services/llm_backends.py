@@ -0,0 +1,126 @@
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import torch
+from transformers import AutoModelForCausalLM, DynamicCache
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("fp32", "bf16", "int8", "compile", "onnx")
+
+
+@dataclass
+class LoadedBackend:
+    name: str
+    model: object
+    device: str
+    cache_implementation: str
+
+
+def resolve_device(device: str) -> str:
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def configure_threads(num_threads: int, interop_threads: int = 0):
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            logger.warning(f"Inter-op thread count could not be changed: {str(e)}")
+
+
+def process_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _load_torch(model_id: str, device: str, dtype: torch.dtype, token: Optional[str], local_files_only: bool):
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id,
+        torch_dtype=dtype,
+        token=token,
+        local_files_only=local_files_only,
+        use_safetensors=True if local_files_only else None,
+        low_cpu_mem_usage=True
+    )
+    model.eval()
+    return model.to(device)
+
+
+def _load_onnx(model_id: str, onnx_dir: Optional[str], token: Optional[str], local_files_only: bool):
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError:
+        raise RuntimeError("MODEL_BACKEND=onnx requires `pip install optimum[onnxruntime]`")
+    if onnx_dir and os.path.isdir(onnx_dir):
+        return ORTModelForCausalLM.from_pretrained(onnx_dir, use_cache=True, provider="CPUExecutionProvider")
+    model = ORTModelForCausalLM.from_pretrained(
+        model_id, export=True, use_cache=True, provider="CPUExecutionProvider",
+        token=token, local_files_only=local_files_only
+    )
+    if onnx_dir:
+        model.save_pretrained(onnx_dir)
+    return model
+
+
+def load_backend(name: str, model_id: str, device: str, cache_implementation: str = "new",
+                 token: Optional[str] = None, onnx_dir: Optional[str] = None,
+                 local_files_only: bool = False) -> LoadedBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown MODEL_BACKEND {name!r}, expected one of {BACKENDS}")
+    if name in ("int8", "onnx") and device != "cpu":
+        logger.warning(f"Backend {name} runs on CPU only, ignoring device {device}")
+        device = "cpu"
+
+    rss_before = process_rss_bytes()
+    if name == "onnx":
+        model = _load_onnx(model_id, onnx_dir, token, local_files_only)
+        cache_implementation = "legacy"
+    elif name == "bf16":
+        model = _load_torch(model_id, device, torch.bfloat16, token, local_files_only)
+    else:
+        model = _load_torch(model_id, device, torch.float32, token, local_files_only)
+        if name == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif name == "compile":
+            model.forward = torch.compile(model.forward, dynamic=True)
+
+    logger.info(
+        f"Loaded {model_id} with backend {name} on {device}, "
+        f"resident memory +{(process_rss_bytes() - rss_before) / 2 ** 20:.0f} MiB"
+    )
+    return LoadedBackend(name, model, device, cache_implementation)
+
+
+@torch.inference_mode()
+def measure_decode_speed(backend: LoadedBackend, input_ids: List[int], steps: int) -> float:
+    ids = torch.tensor([input_ids], dtype=torch.long, device=backend.device)
+    mask = torch.ones_like(ids)
+    output = backend.model(input_ids=ids, attention_mask=mask, use_cache=True)
+    past = output.past_key_values
+    started = time.perf_counter()
+    for _ in range(steps):
+        token = output.logits[:, -1:, :].argmax(dim=-1)
+        mask = torch.cat([mask, mask.new_ones((1, 1))], dim=1)
+        if backend.cache_implementation != "legacy" and not isinstance(past, DynamicCache):
+            past = DynamicCache.from_legacy_cache(past)
+        output = backend.model(
+            input_ids=token,
+            attention_mask=mask,
+            position_ids=torch.tensor([[mask.shape[1] - 1]], device=backend.device),
+            past_key_values=past,
+            use_cache=True,
+        )
+        past = output.past_key_values
+    return steps / (time.perf_counter() - started)
@@ -0,0 +1,380 @@
+import asyncio
+import os
+from transformers import AutoTokenizer, TextIteratorStreamer
+import logging
+from threading import Lock
+from typing import FrozenSet, List, Dict, Tuple, Iterator, Optional
+import re
+from src.config import settings
+from src.services.llm_backends import configure_threads, load_backend, measure_decode_speed, resolve_device
+from src.monitoring.prometheus_metrics import observe_generation, stage
+from src.services.llm_scheduler import BatchScheduler
+from src.services.prefix_cache import PrefixCache
+from src.services.response_cache import ResponseCache, response_key
+from src.services.speculative import SpeculativeDecoder
+from src.services.stopping import StoppingCriteria
+
+logger = logging.getLogger(__name__)
+
+STOP_CHARS = ("\n", "<")
+STOP_PATTERN = re.compile(r"[\n<]")
+CJK_PATTERN = re.compile("[\u4e00-\u9FFF]")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+TURN_END = "<|im_end|>"
+ASSISTANT_HEADER = "<|im_start|>assistant\n"
+SYSTEM_CONTENT = (
+    "You are NeuroChat, a helpful AI assistant. "
+    "Follow these rules:\n"
+    "1. Be concise and direct\n"
+    "2. Use the same language as user\n"
+    "3. For simple questions (math, facts) give short answers\n"
+    "4. Format answers clearly\n"
+    "5. Avoid Chinese characters\n"
+)
+SYSTEM_BLOCK = "\n".join(["<|im_start|>system", SYSTEM_CONTENT, "<|im_end|>"])
+SUMMARY_INSTRUCTION = (
+    "Summarize the conversation below in a few sentences. "
+    "Keep names, facts, numbers and decisions the user may refer to later. "
+    "Use the same language as the conversation.\n"
+)
+
+
+class ResponsePostprocessor:
+    def __init__(self):
+        self.stopped = False
+        self.started = False
+        self.space = False
+
+    def feed(self, chunk: str) -> str:
+        if self.stopped:
+            return ""
+        match = STOP_PATTERN.search(chunk)
+        if match:
+            chunk = chunk[:match.start()]
+            self.stopped = True
+        out = []
+        for i, piece in enumerate(WHITESPACE_PATTERN.split(CJK_PATTERN.sub("", chunk))):
+            if i:
+                self.space = True
+            if piece:
+                if self.space and self.started:
+                    out.append(" ")
+                out.append(piece)
+                self.started, self.space = True, False
+        return "".join(out)
+
+
+class NeuroChatProcessor:
+    def __init__(self, start: bool = True):
+        self.model = None
+        self.tokenizer = None
+        self.scheduler = None
+        self.prefix_cache = None
+        self.response_cache = None
+        self.system_prefix_ids = []
+        self.assistant_header_ids = []
+        self.stopping = None
+        self.summary_stopping = None
+        self.device = None
+        self.backend = None
+        self.draft_backend = None
+        self.speculator = None
+        self.generation_kwargs = {}
+        self.tokenizer_lock = Lock()
+        if self.load_model() and start:
+            self.start()
+
+    def load_model(self):
+        try:
+            configure_threads(settings.TORCH_NUM_THREADS, settings.TORCH_INTEROP_THREADS)
+            model_path = settings.MODEL_LOCAL_PATH or settings.MODEL_ID
+            local_files_only = bool(settings.MODEL_LOCAL_PATH)
+            if local_files_only and not os.path.isdir(model_path):
+                raise FileNotFoundError(f"MODEL_LOCAL_PATH {model_path} does not exist")
+            self.tokenizer = AutoTokenizer.from_pretrained(
+                model_path, token=settings.HF_TOKEN, local_files_only=local_files_only
+            )
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+
+            self.backend = load_backend(
+                settings.MODEL_BACKEND,
+                model_path,
+                resolve_device(settings.MODEL_DEVICE),
+                cache_implementation=settings.MODEL_CACHE_IMPLEMENTATION,
+                token=settings.HF_TOKEN,
+                local_files_only=local_files_only,
+                onnx_dir=settings.MODEL_ONNX_DIR
+            )
+            self.model = self.backend.model
+            self.device = self.backend.device
+            if settings.MODEL_DRAFT_ID:
+                self.draft_backend = self.load_draft_model()
+
+            self.generation_kwargs = dict(
+                max_new_tokens=50,
+                do_sample=True,
+                temperature=0.4,
+                top_p=0.85,
+                top_k=40,
+                repetition_penalty=1.2,
+                no_repeat_ngram_size=2
+            )
+            self.system_prefix_ids = self.encode(SYSTEM_BLOCK + "\n")
+            self.assistant_header_ids = self.encode(ASSISTANT_HEADER, add_special_tokens=False)
+            stop_token_ids, turn_end_ids = self.find_stop_tokens()
+            self.stopping = StoppingCriteria(self.tokenizer.eos_token_id, turn_end_ids, stop_token_ids)
+            self.summary_stopping = StoppingCriteria(self.tokenizer.eos_token_id, turn_end_ids)
+            return True
+        except Exception as e:
+            logger.error(f"Model loading error: {str(e)}")
+            return False
+
+    def load_draft_model(self):
+        if self.backend.cache_implementation == "legacy":
+            logger.warning(f"Speculative decoding is not supported with backend {self.backend.name}")
+            return None
+        return load_backend(
+            self.backend.name,
+            settings.MODEL_DRAFT_ID,
+            self.device,
+            cache_implementation=self.backend.cache_implementation,
+            token=settings.HF_TOKEN,
+            local_files_only=os.path.isdir(settings.MODEL_DRAFT_ID)
+        )
+
+    def start(self):
+        if settings.MODEL_USE_CACHE:
+            self.prefix_cache = PrefixCache(
+                max_entries=settings.PREFIX_CACHE_MAX_ENTRIES,
+                max_bytes=settings.PREFIX_CACHE_MAX_MB * 1024 * 1024
+            )
+        if settings.RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(
+                max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+                max_bytes=settings.RESPONSE_CACHE_MAX_MB * 1024 * 1024
+            )
+        if self.draft_backend is not None:
+            self.speculator = SpeculativeDecoder(
+                self.draft_backend.model,
+                lookahead=settings.MODEL_DRAFT_LOOKAHEAD,
+                vocab_size=min(self.model.config.vocab_size, self.draft_backend.model.config.vocab_size),
+                device=self.device,
+                cache_implementation=self.backend.cache_implementation
+            )
+        self.scheduler = BatchScheduler(
+            self.model,
+            eos_token_id=self.tokenizer.eos_token_id,
+            pad_token_id=self.tokenizer.pad_token_id,
+            device=self.device,
+            max_batch_size=settings.SCHEDULER_MAX_BATCH_SIZE,
+            max_wait=settings.SCHEDULER_MAX_WAIT_MS / 1000,
+            request_timeout=settings.SCHEDULER_REQUEST_TIMEOUT,
+            prefix_cache=self.prefix_cache,
+            cache_implementation=self.backend.cache_implementation,
+            speculator=self.speculator
+        )
+        self.scheduler.start()
+        try:
+            self.warm_up()
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {str(e)}")
+
+    def find_stop_tokens(self) -> Tuple[FrozenSet[int], FrozenSet[int]]:
+        ids = list(range(len(self.tokenizer)))
+        with self.tokenizer_lock:
+            pieces = self.tokenizer.batch_decode([[i] for i in ids])
+        stop = frozenset(i for i, piece in zip(ids, pieces) if any(c in piece for c in STOP_CHARS))
+        turn_end = frozenset(i for i, piece in zip(ids, pieces) if piece == TURN_END)
+        return stop, turn_end
+
+    def prepare_input_ids(self, messages: List[Dict]) -> List[int]:
+        if not messages or messages[-1]["role"] != "user":
+            return []
+        turns = [f"<|im_start|>{msg['role']}\n{msg['content'].strip()}{TURN_END}\n" for msg in messages]
+        with self.tokenizer_lock:
+            encoded = self.tokenizer(turns, add_special_tokens=False).input_ids
+        input_ids = list(self.system_prefix_ids)
+        for ids in encoded:
+            input_ids.extend(ids)
+        input_ids.extend(self.assistant_header_ids)
+        return input_ids
+
+    def cache_points(self, input_ids: List[int], session: bool = True) -> List[Tuple[int, bool]]:
+        if self.prefix_cache is None:
+            return []
+        points = [(len(self.system_prefix_ids), True)]
+        header = len(self.assistant_header_ids)
+        if session and input_ids[-header:] == self.assistant_header_ids:
+            points.append((len(input_ids) - header, False))
+        return points
+
+    def postprocess_response(self, text: str) -> str:
+        return ResponsePostprocessor().feed(text)
+
+    def response_cache_key(self, messages: List[Dict], use_cache: bool) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        deterministic = not self.generation_kwargs.get("do_sample") or \
+            self.generation_kwargs.get("temperature", 1.0) <= settings.RESPONSE_CACHE_MAX_TEMPERATURE
+        if not use_cache or not deterministic:
+            self.response_cache.bypass()
+            return None
+        return response_key(messages, self.generation_kwargs)
+
+    def encode(self, text: str, add_special_tokens: bool = True) -> List[int]:
+        with self.tokenizer_lock:
+            return self.tokenizer(text, add_special_tokens=add_special_tokens).input_ids
+
+    def warm_up(self):
+        if settings.MODEL_WARMUP_TOKENS <= 0:
+            return
+        input_ids = self.prepare_input_ids([{"role": "user", "content": "Hello"}])
+        tokens_per_second = measure_decode_speed(self.backend, input_ids, settings.MODEL_WARMUP_TOKENS)
+        logger.info(f"Warm-up decode speed with backend {self.backend.name}: {tokens_per_second:.1f} tokens/s")
+
+    def build_input_ids(self, messages: List[Dict]) -> List[int]:
+        with stage("prompt_build"):
+            return self.prepare_input_ids(messages)
+
+    def submit(self, input_ids: List[int], streamer=None, sampling: Optional[dict] = None,
+               stopping: Optional[StoppingCriteria] = None, session: bool = True):
+        return self.scheduler.submit(
+            input_ids, sampling or self.generation_kwargs, streamer=streamer,
+            cache_points=self.cache_points(input_ids, session),
+            stopping=stopping or self.stopping
+        )
+
+    def truncate_tokens(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        with self.tokenizer_lock:
+            ids = self.tokenizer(text, add_special_tokens=False).input_ids
+            if len(ids) <= max_tokens:
+                return text, len(ids)
+            return self.tokenizer.decode(ids[:max_tokens]), max_tokens
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encode(text, add_special_tokens=False))
+
+    def decode_response(self, request) -> Tuple[str, int]:
+        observe_generation(request.timings())
+        with self.tokenizer_lock:
+            response = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+        return self.postprocess_response(response), len(request.generated)
+
+    def cached_response(self, key: Optional[str]) -> Optional[Tuple[str, int]]:
+        return self.response_cache.get(key) if key else None
+
+    def store_response(self, key: Optional[str], response: Tuple[str, int]) -> Tuple[str, int]:
+        if key and response[0]:
+            self.response_cache.put(key, response)
+        return response
+
+    def generate_response(self, messages: List[Dict], use_cache: bool = True) -> Tuple[str, int]:
+        input_ids = self.build_input_ids(messages)
+        if not input_ids:
+            return "Invalid conversation format", 0
+        key = self.response_cache_key(messages, use_cache)
+        cached = self.cached_response(key)
+        if cached:
+            return cached
+        request = self.submit(input_ids)
+        request.future.result()
+        return self.store_response(key, self.decode_response(request))
+
+    async def agenerate_response(self, messages: List[Dict], use_cache: bool = True) -> Tuple[str, int]:
+        input_ids = self.build_input_ids(messages)
+        if not input_ids:
+            return "Invalid conversation format", 0
+        key = self.response_cache_key(messages, use_cache)
+        cached = self.cached_response(key)
+        if cached:
+            return cached
+        request = self.submit(input_ids)
+        try:
+            await asyncio.wrap_future(request.future)
+        except asyncio.CancelledError:
+            request.cancel()
+            raise
+        return self.store_response(key, self.decode_response(request))
+
+    def summary_request(self, summary: str, turns: List[Dict]):
+        transcript = "\n".join(f"{turn['role']}: {turn['content'].strip()}" for turn in turns)
+        if summary:
+            transcript = f"Earlier summary: {summary}\n{transcript}"
+        input_ids = self.prepare_input_ids([{"role": "user", "content": SUMMARY_INSTRUCTION + transcript}])
+        sampling = {
+            "max_new_tokens": settings.SUMMARY_MAX_TOKENS,
+            "do_sample": False,
+            "repetition_penalty": self.generation_kwargs.get("repetition_penalty", 1.0),
+        }
+        return self.submit(input_ids, sampling=sampling, stopping=self.summary_stopping, session=False)
+
+    def decode_summary(self, request) -> str:
+        with self.tokenizer_lock:
+            text = self.tokenizer.decode(request.generated, skip_special_tokens=True)
+        text = CJK_PATTERN.sub("", text.split(TURN_END)[0])
+        return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+    def summarize(self, summary: str, turns: List[Dict]) -> Optional[str]:
+        try:
+            request = self.summary_request(summary, turns)
+            request.future.result()
+            return self.decode_summary(request)
+        except Exception as e:
+            logger.error(f"Summarization error: {str(e)}")
+            return None
+
+    async def asummarize(self, summary: str, turns: List[Dict]) -> Optional[str]:
+        try:
+            request = self.summary_request(summary, turns)
+            try:
+                await asyncio.wrap_future(request.future)
+            except asyncio.CancelledError:
+                request.cancel()
+                raise
+            return self.decode_summary(request)
+        except Exception as e:
+            logger.error(f"Summarization error: {str(e)}")
+            return None
+
+    def stream_response(self, messages: List[Dict], use_cache: bool = True) -> Iterator[str]:
+        input_ids = self.build_input_ids(messages)
+        if not input_ids:
+            yield "Invalid conversation format"
+            return
+        key = self.response_cache_key(messages, use_cache)
+        cached = self.cached_response(key)
+        if cached:
+            yield cached[0]
+            return
+
+        streamer = TextIteratorStreamer(
+            self.tokenizer, skip_special_tokens=True, timeout=settings.SCHEDULER_REQUEST_TIMEOUT
+        )
+        request = self.submit(input_ids, streamer=streamer)
+
+        postprocessor, emitted = ResponsePostprocessor(), []
+        try:
+            for chunk in streamer:
+                delta = postprocessor.feed(chunk)
+                if delta:
+                    emitted.append(delta)
+                    yield delta
+                if postprocessor.stopped:
+                    break
+            self.store_response(key, ("".join(emitted), len(request.generated)))
+        finally:
+            request.cancel()
+            observe_generation(request.timings())
+
+    def shutdown(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def runtime_stats(self) -> dict:
+        return {
+            "scheduler": self.scheduler.stats() if self.scheduler else None,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache else None,
+            "response_cache": self.response_cache.stats() if self.response_cache else None,
+            "speculative": self.speculator.stats() if self.speculator else None
+        }
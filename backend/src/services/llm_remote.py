@@ -0,0 +1,133 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Connection
+from threading import Lock
+from typing import List, Dict, Tuple, Iterator, Optional
+from transformers import AutoTokenizer
+from src.config import settings
+from src.monitoring.prometheus_metrics import replay_observations
+from src.inference_server import authkey, replica_addresses
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteProcessor:
+    def __init__(self):
+        self.addresses = replica_addresses()
+        self.authkey = authkey()
+        self._idle = {address: [] for address in self.addresses}
+        self._idle_lock = Lock()
+        self._next_replica = itertools.cycle(self.addresses)
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.INFERENCE_CLIENT_MAX_INFLIGHT, thread_name_prefix="inference-client"
+        )
+        self.tokenizer_lock = Lock()
+        model_path = settings.MODEL_LOCAL_PATH or settings.MODEL_ID
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            model_path, token=settings.HF_TOKEN, local_files_only=bool(settings.MODEL_LOCAL_PATH)
+        )
+        self.model = self.addresses
+        for address in self.addresses:
+            self._release(address, self._connect(address))
+
+    def _connect(self, address: str) -> Connection:
+        return Client(address, family="AF_UNIX", authkey=self.authkey)
+
+    def _acquire(self, address: Optional[str] = None) -> Tuple[str, Connection]:
+        with self._idle_lock:
+            address = address or next(self._next_replica)
+            if self._idle[address]:
+                return address, self._idle[address].pop()
+        return address, self._connect(address)
+
+    def _release(self, address: str, conn: Connection):
+        with self._idle_lock:
+            self._idle[address].append(conn)
+
+    def _call(self, request: dict, address: Optional[str] = None):
+        address, conn = self._acquire(address)
+        try:
+            conn.send(request)
+            kind, payload, observations = conn.recv()
+        except Exception:
+            conn.close()
+            raise
+        self._release(address, conn)
+        if kind == "error":
+            raise RuntimeError(payload)
+        replay_observations(observations)
+        return payload
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, contextvars.copy_context().run, func, *args)
+
+    def truncate_tokens(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        with self.tokenizer_lock:
+            ids = self.tokenizer(text, add_special_tokens=False).input_ids
+            if len(ids) <= max_tokens:
+                return text, len(ids)
+            return self.tokenizer.decode(ids[:max_tokens]), max_tokens
+
+    def count_tokens(self, text: str) -> int:
+        with self.tokenizer_lock:
+            return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def generate_response(self, messages: List[Dict], use_cache: bool = True) -> Tuple[str, int]:
+        return tuple(self._call({"op": "generate", "messages": messages, "use_cache": use_cache}))
+
+    async def agenerate_response(self, messages: List[Dict], use_cache: bool = True) -> Tuple[str, int]:
+        return await self._run(self.generate_response, messages, use_cache)
+
+    def summarize(self, summary: str, turns: List[Dict]) -> Optional[str]:
+        try:
+            return self._call({"op": "summarize", "summary": summary, "turns": turns})
+        except Exception as e:
+            logger.error(f"Remote summarization error: {str(e)}")
+            return None
+
+    async def asummarize(self, summary: str, turns: List[Dict]) -> Optional[str]:
+        return await self._run(self.summarize, summary, turns)
+
+    def stream_response(self, messages: List[Dict], use_cache: bool = True) -> Iterator[str]:
+        address, conn = self._acquire()
+        finished = False
+        try:
+            conn.send({"op": "stream", "messages": messages, "use_cache": use_cache})
+            while True:
+                kind, payload, observations = conn.recv()
+                if kind == "end":
+                    finished = True
+                    replay_observations(observations)
+                    break
+                if kind == "error":
+                    raise RuntimeError(payload)
+                yield payload
+        finally:
+            if finished:
+                self._release(address, conn)
+            else:
+                conn.close()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._idle_lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+                connections.clear()
+
+    def runtime_stats(self) -> dict:
+        replicas = {}
+        for address in self.addresses:
+            try:
+                replicas[address] = self._call({"op": "stats"}, address)
+            except Exception as e:
+                replicas[address] = {"error": str(e)}
+        return {"inference_mode": "remote", "replicas": replicas}
+
+    async def aruntime_stats(self) -> dict:
+        return await self._run(self.runtime_stats)
@@ -0,0 +1,371 @@
+import logging
+import queue
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from threading import Thread, Event
+from typing import List, Optional, Tuple
+
+import torch
+from transformers import (
+    DynamicCache,
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    NoRepeatNGramLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+from src.services.stopping import DEADLINE, EARLY_STOPS, StoppingCriteria
+
+logger = logging.getLogger(__name__)
+
+
+def build_logits_processor(sampling: dict) -> LogitsProcessorList:
+    processors = LogitsProcessorList()
+    if sampling.get("repetition_penalty", 1.0) != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(sampling["repetition_penalty"]))
+    if sampling.get("no_repeat_ngram_size"):
+        processors.append(NoRepeatNGramLogitsProcessor(sampling["no_repeat_ngram_size"]))
+    if sampling.get("do_sample"):
+        if sampling.get("temperature", 1.0) != 1.0:
+            processors.append(TemperatureLogitsWarper(sampling["temperature"]))
+        if sampling.get("top_k"):
+            processors.append(TopKLogitsWarper(sampling["top_k"]))
+        if sampling.get("top_p", 1.0) < 1.0:
+            processors.append(TopPLogitsWarper(sampling["top_p"]))
+    return processors
+
+
+def to_legacy_cache(past) -> Tuple:
+    if hasattr(past, "to_legacy_cache"):
+        return past.to_legacy_cache()
+    return tuple((k, v) for k, v in past)
+
+
+def to_model_cache(past, implementation: str = "new"):
+    if past is None or implementation == "legacy":
+        return past
+    return DynamicCache.from_legacy_cache(past)
+
+
+@dataclass
+class GenerationRequest:
+    input_ids: List[int]
+    sampling: dict
+    max_new_tokens: int
+    deadline: float
+    streamer: Optional[object] = None
+    future: Future = field(default_factory=Future)
+    generated: List[int] = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancelled: Event = field(default_factory=Event)
+    processors: LogitsProcessorList = None
+    cache_points: List[Tuple[int, bool]] = field(default_factory=list)
+    stopping: StoppingCriteria = None
+    stop_reason: Optional[str] = None
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def timings(self) -> dict:
+        started = self.started_at or self.finished_at or self.enqueued_at
+        first_token = self.first_token_at or started
+        finished = self.finished_at or time.monotonic()
+        return {
+            "queue_wait": started - self.enqueued_at,
+            "prefill": first_token - started,
+            "decode": finished - first_token,
+            "tokens": len(self.generated),
+            "stop_reason": self.stop_reason,
+            "tokens_saved": max(self.max_new_tokens - len(self.generated), 0) if self.stop_reason in EARLY_STOPS else 0,
+        }
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.finished_at is None:
+            self.finished_at = time.monotonic()
+        if self.streamer is not None:
+            self.streamer.end()
+        if self.future.done():
+            return
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(self.generated)
+
+
+class BatchState:
+    def __init__(self, past: Tuple, attention_mask: torch.Tensor, last_tokens: torch.Tensor):
+        self.past = past
+        self.attention_mask = attention_mask
+        self.last_tokens = last_tokens
+
+    def merge(self, other: "BatchState") -> "BatchState":
+        length = max(self.attention_mask.shape[1], other.attention_mask.shape[1])
+        a, b = self._left_pad(length), other._left_pad(length)
+        past = tuple(
+            (torch.cat([ka, kb], dim=0), torch.cat([va, vb], dim=0))
+            for (ka, va), (kb, vb) in zip(a.past, b.past)
+        )
+        return BatchState(
+            past,
+            torch.cat([a.attention_mask, b.attention_mask], dim=0),
+            torch.cat([a.last_tokens, b.last_tokens], dim=0),
+        )
+
+    def select(self, rows: List[int]) -> "BatchState":
+        index = torch.tensor(rows, device=self.attention_mask.device)
+        mask = self.attention_mask.index_select(0, index)
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        past = tuple(
+            (k.index_select(0, index)[:, :, start:], v.index_select(0, index)[:, :, start:])
+            for k, v in self.past
+        )
+        return BatchState(past, mask[:, start:], self.last_tokens.index_select(0, index))
+
+    def _left_pad(self, length: int) -> "BatchState":
+        pad = length - self.attention_mask.shape[1]
+        if pad == 0:
+            return self
+        past = []
+        for k, v in self.past:
+            shape = list(k.shape)
+            shape[2] = pad
+            past.append((
+                torch.cat([k.new_zeros(shape), k], dim=2),
+                torch.cat([v.new_zeros(shape), v], dim=2),
+            ))
+        mask = torch.cat([self.attention_mask.new_zeros((self.attention_mask.shape[0], pad)), self.attention_mask], dim=1)
+        return BatchState(tuple(past), mask, self.last_tokens)
+
+
+class BatchScheduler:
+    def __init__(self, model, eos_token_id: int, pad_token_id: int, device: str,
+                 max_batch_size: int, max_wait: float, request_timeout: float,
+                 prefix_cache=None, cache_implementation: str = "new", speculator=None):
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.speculator = speculator
+        self.cache_implementation = cache_implementation
+        self.eos_token_id = eos_token_id
+        self.stopping = StoppingCriteria(eos_token_id)
+        self.pad_token_id = pad_token_id
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.request_timeout = request_timeout
+        self.queue = queue.Queue()
+        self.active: List[GenerationRequest] = []
+        self.state: Optional[BatchState] = None
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name="llm-scheduler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "active": len(self.active)}
+
+    def submit(self, input_ids: List[int], sampling: dict, streamer=None,
+               cache_points: List[Tuple[int, bool]] = (),
+               stopping: Optional[StoppingCriteria] = None) -> GenerationRequest:
+        request = GenerationRequest(
+            input_ids=list(input_ids),
+            sampling=sampling,
+            max_new_tokens=sampling.get("max_new_tokens", 50),
+            deadline=time.monotonic() + self.request_timeout,
+            streamer=streamer,
+            processors=build_logits_processor(sampling),
+            cache_points=list(cache_points),
+            stopping=stopping or self.stopping,
+        )
+        self.queue.put(request)
+        return request
+
+    def _run(self):
+        while not self._stopped.is_set():
+            incoming = self._collect()
+            try:
+                if incoming:
+                    self._prefill(incoming)
+                if self._can_speculate():
+                    self._speculative_step()
+                elif self.active:
+                    self._decode_step()
+            except Exception as e:
+                logger.error(f"Batch generation error: {str(e)}")
+                for request in self.active + incoming:
+                    request.finish(e)
+                self.active, self.state = [], None
+
+    def _collect(self) -> List[GenerationRequest]:
+        capacity = self.max_batch_size - len(self.active)
+        incoming = []
+        if capacity <= 0:
+            return incoming
+        if not self.active:
+            try:
+                incoming.append(self.queue.get(timeout=0.1))
+            except queue.Empty:
+                return incoming
+            wait_until = time.monotonic() + self.max_wait
+        else:
+            wait_until = time.monotonic()
+        while len(incoming) < capacity:
+            timeout = wait_until - time.monotonic()
+            try:
+                if timeout > 0:
+                    incoming.append(self.queue.get(timeout=timeout))
+                else:
+                    incoming.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        now = time.monotonic()
+        ready = []
+        for request in incoming:
+            if request.cancelled.is_set():
+                request.finish()
+            elif now > request.deadline:
+                request.finish(TimeoutError("Generation request timed out in queue"))
+            else:
+                ready.append(request)
+        return ready
+
+    def _prefill(self, requests: List[GenerationRequest]):
+        started = time.monotonic()
+        for request in requests:
+            request.started_at = started
+        if self.prefix_cache is not None:
+            states = [self._prefill_cached(request) for request in requests]
+        else:
+            states = [self._prefill_batch(requests)]
+        for state in states:
+            self.state = state if self.state is None else self.state.merge(state)
+        self.active.extend(requests)
+        self._retire()
+
+    @torch.inference_mode()
+    def _prefill_cached(self, request: GenerationRequest) -> BatchState:
+        ids = request.input_ids
+        reused, past = self.prefix_cache.lookup(ids)
+        attention_mask = torch.ones((1, len(ids)), dtype=torch.long, device=self.device)
+        output = self.model(
+            input_ids=torch.tensor([ids[reused:]], dtype=torch.long, device=self.device),
+            attention_mask=attention_mask,
+            position_ids=torch.arange(reused, len(ids), device=self.device).unsqueeze(0),
+            past_key_values=to_model_cache(past, self.cache_implementation),
+            use_cache=True,
+        )
+        full = to_legacy_cache(output.past_key_values)
+        for length, pinned in request.cache_points:
+            if reused < length < len(ids):
+                self.prefix_cache.store(
+                    ids[:length], tuple((k[:, :, :length], v[:, :, :length]) for k, v in full), pinned
+                )
+                if reused and not pinned:
+                    self.prefix_cache.discard(ids[:reused])
+        return BatchState(full, attention_mask, self._sample([request], output.logits[:, -1, :]))
+
+    @torch.inference_mode()
+    def _prefill_batch(self, requests: List[GenerationRequest]) -> BatchState:
+        length = max(len(r.input_ids) for r in requests)
+        input_ids = torch.full((len(requests), length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(requests), length), dtype=torch.long)
+        for row, request in enumerate(requests):
+            input_ids[row, length - len(request.input_ids):] = torch.tensor(request.input_ids)
+            attention_mask[row, length - len(request.input_ids):] = 1
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=True,
+        )
+        return BatchState(
+            to_legacy_cache(output.past_key_values),
+            attention_mask,
+            self._sample(requests, output.logits[:, -1, :]),
+        )
+
+    def _can_speculate(self) -> bool:
+        return (
+            self.speculator is not None
+            and len(self.active) == 1
+            and self.queue.empty()
+            and self.speculator.can_step(self.active[0])
+            and bool(self.state.attention_mask.all())
+        )
+
+    def _speculative_step(self):
+        self.state = self.speculator.step(self.model, self.active[0], self.state)
+        self._retire()
+
+    @torch.inference_mode()
+    def _decode_step(self):
+        state = self.state
+        attention_mask = torch.cat(
+            [state.attention_mask, state.attention_mask.new_ones((state.attention_mask.shape[0], 1))], dim=1
+        )
+        position_ids = attention_mask.sum(dim=-1, keepdim=True) - 1
+        output = self.model(
+            input_ids=state.last_tokens.unsqueeze(-1),
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=to_model_cache(state.past, self.cache_implementation),
+            use_cache=True,
+        )
+        self.state = BatchState(
+            to_legacy_cache(output.past_key_values),
+            attention_mask,
+            self._sample(self.active, output.logits[:, -1, :]),
+        )
+        self._retire()
+
+    def _sample(self, requests: List[GenerationRequest], logits: torch.Tensor) -> torch.Tensor:
+        tokens = []
+        for request, row in zip(requests, logits):
+            ids = torch.tensor([request.input_ids + request.generated], device=row.device)
+            scores = request.processors(ids, row.unsqueeze(0).float())
+            if request.sampling.get("do_sample"):
+                token = int(torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1))
+            else:
+                token = int(scores.argmax(dim=-1))
+            request.generated.append(token)
+            if request.first_token_at is None:
+                request.first_token_at = time.monotonic()
+            if request.streamer is not None and not request.stopping.ends_turn(token):
+                request.streamer.put(torch.tensor([token]))
+            tokens.append(token)
+        return torch.tensor(tokens, dtype=torch.long, device=logits.device)
+
+    def _retire(self):
+        now = time.monotonic()
+        keep = []
+        for row, request in enumerate(self.active):
+            reason = request.stopping(request, now)
+            if reason is None:
+                keep.append(row)
+                continue
+            if request.generated and request.stopping.ends_turn(request.generated[-1]):
+                request.generated.pop()
+            elif reason == DEADLINE:
+                logger.warning("Generation request hit its timeout, returning partial output")
+            request.stop_reason = reason
+            request.finish()
+        if len(keep) == len(self.active):
+            return
+        if self.speculator is not None and all(self.active[row] is not self.speculator.request for row in keep):
+            self.speculator.reset()
+        self.active = [self.active[row] for row in keep]
+        self.state = self.state.select(keep) if keep else None
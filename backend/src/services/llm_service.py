@@ -1,109 +1,122 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+import asyncio
 import logging
-from threading import Lock
-from typing import List, Dict, Tuple
-import re
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import Callable, List, Dict, Tuple, Iterator, Optional
 
 logger = logging.getLogger(__name__)
 
-class NeuroChatProcessor:
-    def __init__(self):
-        self.model = None
-        self.tokenizer = None
-        self.pipe = None
-        self.lock = Lock()
-        self.load_model()
-
-    def load_model(self):
-        try:
-            model_id = "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B"
-            self.tokenizer = AutoTokenizer.from_pretrained(model_id)
-            self.model = AutoModelForCausalLM.from_pretrained(model_id)
-            
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
-                
-            self.model.eval()
-            
-            self.pipe = pipeline(
-                "text-generation",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                device="cuda" if torch.cuda.is_available() else "cpu",
-                max_new_tokens=50,
-                do_sample=True,
-                temperature=0.4,
-                top_p=0.85,
-                top_k=40,
-                repetition_penalty=1.2,
-                no_repeat_ngram_size=2,
-                eos_token_id=self.tokenizer.eos_token_id,
-                pad_token_id=self.tokenizer.eos_token_id
-            )
-            return True
-        except Exception as e:
-            logger.error(f"Model loading error: {str(e)}")
-            return False
-
-    def prepare_prompt(self, messages: List[Dict]) -> str:
-        system_content = (
-            "You are NeuroChat, a helpful AI assistant. "
-            "Follow these rules:\n"
-            "1. Be concise and direct\n"
-            "2. Use the same language as user\n"
-            "3. For simple questions (math, facts) give short answers\n"
-            "4. Format answers clearly\n"
-            "5. Avoid Chinese characters\n"
-        )
-
-        if not messages or messages[-1]["role"] != "user":
-            return ""
-
-        formatted_dialog = []
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"].strip()
-            formatted_dialog.append(f"<|im_start|>{role}\n{content}<|im_end|>")
-        
-        prompt = [
-            "<|im_start|>system",
-            system_content,
-            "<|im_end|>",
-            *formatted_dialog,
-            "<|im_start|>assistant\n"
-        ]
-        
-        return "\n".join(prompt)
-
-    def postprocess_response(self, text: str) -> str:
-        text = re.sub("[\u4e00-\u9FFF]", "", text)
-        text = re.split(r"[\n<]", text)[0]
-        text = re.sub(r"\s+", " ", text).strip()
-        text = re.sub(r"([?.!])$", r"\1", text)
-        return text
-
-    def generate_response(self, messages: List[Dict]) -> Tuple[str, int]:
-        with self.lock:
-            try:
-                prompt = self.prepare_prompt(messages)
-                if not prompt:
-                    return "Invalid conversation format", 0
-                
-                output = self.pipe(prompt)
-                full_text = output[0]["generated_text"]
-                
-                response = full_text[len(prompt):]
-                processed = self.postprocess_response(response)
-                
-                return processed, len(processed.split())
-            except Exception as e:
-                logger.error(f"Generation error: {str(e)}")
-                return "Error generating response", 0
-
-chat_processor = NeuroChatProcessor()
-
-def generate_response(messages: List[Dict]) -> Tuple[str, int]:
-    if not chat_processor.model:
-        return "Model not loaded", 0
-    return chat_processor.generate_response(messages)
\ No newline at end of file
+_processor = None
+_load_future: Optional[Future] = None
+_load_lock = Lock()
+
+
+class GenerationError(RuntimeError):
+    pass
+
+
+def _load():
+    global _processor
+    try:
+        from src.config import settings
+        if settings.INFERENCE_MODE == "remote":
+            from src.services.llm_remote import RemoteProcessor
+            processor = RemoteProcessor()
+        else:
+            from src.services.llm_engine import NeuroChatProcessor
+            processor = NeuroChatProcessor()
+        if not processor.model:
+            raise RuntimeError("Model not loaded")
+        _processor = processor
+        _load_future.set_result(processor)
+    except BaseException as e:
+        logger.error(f"Model initialization failed: {str(e)}")
+        _load_future.set_exception(e)
+
+
+def ensure_loaded() -> Future:
+    global _load_future
+    with _load_lock:
+        if _load_future is None or (_load_future.done() and _load_future.exception() is not None):
+            _load_future = Future()
+            Thread(target=_load, name="llm-loader", daemon=True).start()
+        return _load_future
+
+
+def readiness() -> str:
+    if _processor is not None:
+        return "ready"
+    if _load_future is None:
+        return "not_loaded"
+    if _load_future.done():
+        return "failed"
+    return "loading"
+
+
+def get_processor():
+    return ensure_loaded().result()
+
+
+async def aget_processor():
+    return await asyncio.wrap_future(ensure_loaded())
+
+
+def shutdown():
+    if _processor is not None:
+        _processor.shutdown()
+
+
+def generate_response(messages: List[Dict], use_cache: bool = True) -> Tuple[str, int]:
+    try:
+        return get_processor().generate_response(messages, use_cache)
+    except Exception as e:
+        logger.error(f"Generation error: {str(e)}")
+        raise GenerationError(str(e)) from e
+
+
+def get_token_truncator() -> Optional[Callable[[str, int], Tuple[str, int]]]:
+    if _processor is None:
+        return None
+    return _processor.truncate_tokens
+
+
+def count_tokens(text: str) -> int:
+    if _processor is None:
+        return len(text.split())
+    return _processor.count_tokens(text)
+
+
+async def agenerate_response(messages: List[Dict], use_cache: bool = True) -> Tuple[str, int]:
+    try:
+        processor = await aget_processor()
+        return await processor.agenerate_response(messages, use_cache)
+    except Exception as e:
+        logger.error(f"Generation error: {str(e)}")
+        raise GenerationError(str(e)) from e
+
+
+async def asummarize(summary: str, turns: List[Dict]) -> Optional[str]:
+    if _processor is None:
+        return None
+    return await _processor.asummarize(summary, turns)
+
+
+def stream_response(messages: List[Dict], use_cache: bool = True) -> Iterator[str]:
+    try:
+        yield from get_processor().stream_response(messages, use_cache)
+    except Exception as e:
+        logger.error(f"Generation error: {str(e)}")
+        raise GenerationError(str(e)) from e
+
+
+def get_scheduler_stats() -> Optional[dict]:
+    scheduler = getattr(_processor, "scheduler", None)
+    return scheduler.stats() if scheduler else None
+
+
+async def aget_runtime_stats() -> dict:
+    stats = {"model": readiness()}
+    if _processor is not None:
+        aruntime_stats = getattr(_processor, "aruntime_stats", None)
+        stats.update(await aruntime_stats() if aruntime_stats else _processor.runtime_stats())
+    return stats
@@ -0,0 +1,106 @@
+import logging
+import queue
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+from pymongo.errors import BulkWriteError
+from src.db.mongo_client import get_db
+from src.services.telemetry import TelemetrySink
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+MAX_RETRY_INTERVAL = 5.0
+SHUTDOWN_ATTEMPTS = 3
+
+
+class MessageWriter(TelemetrySink):
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float, retry_interval: float,
+                 on_advanced: Callable[[str, Optional[str], str], None], name: str = "chat-writer"):
+        super().__init__(max_queue, batch_size, flush_interval, mlflow_enabled=False, name=name)
+        self.retry_interval = retry_interval
+        self.on_advanced = on_advanced
+        self.counters = {"enqueued": 0, "overflow": 0, "written": 0, "write_errors": 0, "retries": 0, "lost": 0}
+        self.pending: Dict[str, List[dict]] = {}
+        self._pending_lock = Lock()
+
+    def enqueue_turn(self, session_id: str, messages: List[dict], seen: Optional[str], stored: bool = False) -> bool:
+        with self._pending_lock:
+            try:
+                self.queue.put_nowait((session_id, messages, seen, stored))
+            except queue.Full:
+                self._count("overflow")
+                return False
+            if not stored:
+                self.pending.setdefault(session_id, []).extend(messages)
+                self._count("enqueued", len(messages))
+        return True
+
+    def queued(self, session_id: str) -> List[dict]:
+        with self._pending_lock:
+            return list(self.pending.get(session_id, ()))
+
+    def has_queued(self, session_id: str) -> bool:
+        with self._pending_lock:
+            return session_id in self.pending
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            pending_sessions = len(self.pending)
+        return {**super().stats(), "pending_sessions": pending_sessions}
+
+    def _flush(self, batch: List[Tuple]):
+        attempt = 0
+        while True:
+            try:
+                self._write(batch)
+                return
+            except Exception as e:
+                attempt += 1
+                self._count("write_errors")
+                if self._stopped.is_set() and attempt >= SHUTDOWN_ATTEMPTS:
+                    lost = sum(len(messages) for _, messages, _, stored in batch if not stored)
+                    self._count("lost", lost)
+                    self._settle(batch)
+                    logger.error(f"Chat write-behind gave up on {lost} messages at shutdown: {str(e)}")
+                    return
+                delay = min(self.retry_interval * 2 ** (attempt - 1), MAX_RETRY_INTERVAL)
+                logger.error(f"Chat write-behind flush failed, retrying in {delay:.1f}s: {str(e)}")
+                self._count("retries")
+                self._stopped.wait(delay)
+
+    def _write(self, batch: List[Tuple]):
+        db = get_db()
+        messages = [message for _, turn, _, stored in batch if not stored for message in turn]
+        if messages:
+            try:
+                db.Messages.insert_many(messages, ordered=False)
+            except BulkWriteError as e:
+                if e.details.get("writeConcernErrors") or \
+                        any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", ())):
+                    raise
+            self._settle(batch)
+
+        markers = {}
+        for session_id, turn, seen, _ in batch:
+            marker = markers.setdefault(session_id, [seen, turn[-1]["timestamp"]])
+            marker[1] = max(marker[1], turn[-1]["timestamp"])
+        for session_id, (seen, last_message_at) in markers.items():
+            before = db.Sessions.find_one_and_update(
+                {"session_id": session_id}, {"$max": {"last_message_at": last_message_at}},
+                projection={"last_message_at": 1}
+            )
+            if before is not None and before.get("last_message_at") == seen:
+                self.on_advanced(session_id, seen, max(seen or "", last_message_at))
+        self._count("written", len(messages))
+
+    def _settle(self, batch: List[Tuple]):
+        with self._pending_lock:
+            for session_id, turn, _, _ in batch:
+                written = {message["message_id"] for message in turn}
+                remaining = [
+                    message for message in self.pending.get(session_id, ()) if message["message_id"] not in written
+                ]
+                if remaining:
+                    self.pending[session_id] = remaining
+                else:
+                    self.pending.pop(session_id, None)
@@ -0,0 +1,104 @@
+from collections import Counter, OrderedDict
+from threading import Lock
+from typing import List, Optional, Tuple
+
+
+def cache_nbytes(past: Tuple) -> int:
+    return sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in past)
+
+
+class PrefixCacheEntry:
+    def __init__(self, tokens: Tuple[int, ...], past: Tuple, pinned: bool):
+        self.tokens = tokens
+        self.past = past
+        self.pinned = pinned
+        self.nbytes = cache_nbytes(past)
+
+
+class PrefixCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.lengths = Counter()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tokens_reused = 0
+        self.lock = Lock()
+
+    def lookup(self, input_ids: List[int]) -> Tuple[int, Optional[Tuple]]:
+        with self.lock:
+            for length in sorted(self.lengths, reverse=True):
+                if length >= len(input_ids):
+                    continue
+                prefix = tuple(input_ids[:length])
+                entry = self.entries.get(hash(prefix))
+                if entry is not None and entry.tokens == prefix:
+                    self.entries.move_to_end(hash(prefix))
+                    self.hits += 1
+                    self.tokens_reused += length
+                    return length, entry.past
+            self.misses += 1
+            return 0, None
+
+    def store(self, input_ids: List[int], past: Tuple, pinned: bool = False):
+        tokens = tuple(input_ids)
+        key = hash(tokens)
+        with self.lock:
+            existing = self.entries.get(key)
+            if existing is not None and existing.tokens == tokens:
+                self.entries.move_to_end(key)
+                return
+            entry = PrefixCacheEntry(tokens, tuple((k.clone(), v.clone()) for k, v in past), pinned)
+            if entry.nbytes > self.max_bytes:
+                return
+            if existing is not None:
+                self._remove(key)
+            self.entries[key] = entry
+            self.lengths[len(tokens)] += 1
+            self.nbytes += entry.nbytes
+            self._evict()
+
+    def discard(self, input_ids: List[int]):
+        tokens = tuple(input_ids)
+        with self.lock:
+            entry = self.entries.get(hash(tokens))
+            if entry is not None and entry.tokens == tokens and not entry.pinned:
+                self._remove(hash(tokens))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.lengths.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "tokens_reused": self.tokens_reused,
+            }
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.lengths[len(entry.tokens)] -= 1
+        if not self.lengths[len(entry.tokens)]:
+            del self.lengths[len(entry.tokens)]
+        self.nbytes -= entry.nbytes
+
+    def _evict(self):
+        for key in list(self.entries):
+            if len(self.entries) <= self.max_entries and self.nbytes <= self.max_bytes:
+                return
+            if self.entries[key].pinned:
+                continue
+            self._remove(key)
+            self.evictions += 1
@@ -0,0 +1,130 @@
+from threading import Lock
+from typing import List, Optional
+
+import torch
+
+from src.services.llm_scheduler import BatchState, GenerationRequest, to_legacy_cache, to_model_cache
+
+
+def crop_cache(past, length: int):
+    return tuple((k[:, :, :length], v[:, :, :length]) for k, v in past)
+
+
+class SpeculativeDecoder:
+    def __init__(self, draft_model, lookahead: int, vocab_size: int, device: str,
+                 cache_implementation: str = "new"):
+        self.model = draft_model
+        self.lookahead = lookahead
+        self.vocab_size = vocab_size
+        self.device = device
+        self.cache_implementation = cache_implementation
+        self.request: Optional[GenerationRequest] = None
+        self.past = None
+        self.lock = Lock()
+        self.steps = 0
+        self.proposed = 0
+        self.accepted = 0
+        self.emitted = 0
+
+    def can_step(self, request: GenerationRequest) -> bool:
+        return request.max_new_tokens - len(request.generated) > 1
+
+    def reset(self):
+        self.request, self.past = None, None
+
+    def _forward(self, model, past, tokens: List[int], start: int):
+        return model(
+            input_ids=torch.tensor([tokens], dtype=torch.long, device=self.device),
+            attention_mask=torch.ones((1, start + len(tokens)), dtype=torch.long, device=self.device),
+            position_ids=torch.arange(start, start + len(tokens), device=self.device).unsqueeze(0),
+            past_key_values=to_model_cache(past, self.cache_implementation),
+            use_cache=True,
+        )
+
+    def _scores(self, request: GenerationRequest, ids: List[int], logits: torch.Tensor) -> torch.Tensor:
+        ids = torch.tensor([ids], device=logits.device)
+        return request.processors(ids, logits[:self.vocab_size].unsqueeze(0).float())[0]
+
+    def _pick(self, request: GenerationRequest, scores: torch.Tensor):
+        if request.sampling.get("do_sample"):
+            probs = torch.softmax(scores, dim=-1)
+            return int(torch.multinomial(probs, num_samples=1)), probs
+        return int(scores.argmax()), None
+
+    @torch.inference_mode()
+    def step(self, target_model, request: GenerationRequest, state: BatchState) -> BatchState:
+        seq = request.input_ids + request.generated
+        if self.request is not request:
+            self.request, self.past = request, None
+        cached = self.past[0][0].shape[2] if self.past else 0
+        lookahead = min(self.lookahead, request.max_new_tokens - len(request.generated) - 1)
+
+        drafted, draft_probs = [], []
+        output = self._forward(self.model, self.past, seq[cached:], cached)
+        for i in range(lookahead):
+            self.past = to_legacy_cache(output.past_key_values)
+            token, probs = self._pick(request, self._scores(request, seq + drafted, output.logits[0, -1]))
+            drafted.append(token)
+            draft_probs.append(probs)
+            if request.stopping.match(token) or i == lookahead - 1:
+                break
+            output = self._forward(self.model, self.past, [token], len(seq) + i)
+
+        target_len = state.attention_mask.shape[1]
+        output = self._forward(target_model, state.past, [seq[-1]] + drafted, target_len)
+        logits = output.logits[0]
+
+        new, accepted = [], 0
+        for i, token in enumerate(drafted):
+            scores = self._scores(request, seq + drafted[:i], logits[i])
+            if request.sampling.get("do_sample"):
+                probs = torch.softmax(scores, dim=-1)
+                ratio = probs[token] / draft_probs[i][token]
+                if float(torch.rand(())) >= float(ratio):
+                    residual = (probs - draft_probs[i]).clamp(min=0)
+                    if float(residual.sum()) <= 0:
+                        residual = probs
+                    new.append(int(torch.multinomial(residual / residual.sum(), num_samples=1)))
+                    break
+            elif int(scores.argmax()) != token:
+                new.append(int(scores.argmax()))
+                break
+            new.append(token)
+            accepted += 1
+        else:
+            if not request.stopping.match(drafted[-1]):
+                new.append(self._pick(request, self._scores(request, seq + drafted, logits[len(drafted)]))[0])
+
+        stop = request.stopping.first_stop(new)
+        if stop is not None:
+            new = new[:stop + 1]
+
+        for token in new:
+            request.generated.append(token)
+            if request.streamer is not None and not request.stopping.ends_turn(token):
+                request.streamer.put(torch.tensor([token]))
+
+        self.past = crop_cache(self.past, min(len(seq) + len(drafted) - 1, len(seq) + accepted))
+        with self.lock:
+            self.steps += 1
+            self.proposed += len(drafted)
+            self.accepted += accepted
+            self.emitted += len(new)
+
+        keep = target_len + len(new)
+        return BatchState(
+            crop_cache(to_legacy_cache(output.past_key_values), keep),
+            torch.ones((1, keep), dtype=torch.long, device=self.device),
+            torch.tensor([new[-1]], dtype=torch.long, device=self.device),
+        )
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "lookahead": self.lookahead,
+                "steps": self.steps,
+                "proposed": self.proposed,
+                "accepted": self.accepted,
+                "acceptance_rate": self.accepted / self.proposed if self.proposed else 0.0,
+                "tokens_per_step": self.emitted / self.steps if self.steps else 0.0,
+            }
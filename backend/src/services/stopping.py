@@ -0,0 +1,49 @@
+from typing import FrozenSet, List, Optional
+
+EOS = "eos"
+TURN_END = "turn_end"
+STOP_STRING = "stop_string"
+MAX_TOKENS = "max_tokens"
+CANCELLED = "cancelled"
+DEADLINE = "deadline"
+
+EARLY_STOPS = (EOS, TURN_END, STOP_STRING)
+
+
+class StoppingCriteria:
+    def __init__(self, eos_token_id: Optional[int], turn_end_ids: FrozenSet[int] = frozenset(),
+                 stop_token_ids: FrozenSet[int] = frozenset()):
+        self.eos_token_id = eos_token_id
+        self.turn_end_ids = frozenset(turn_end_ids)
+        self.stop_token_ids = frozenset(stop_token_ids) - self.turn_end_ids
+
+    def match(self, token: int) -> Optional[str]:
+        if token == self.eos_token_id:
+            return EOS
+        if token in self.turn_end_ids:
+            return TURN_END
+        if token in self.stop_token_ids:
+            return STOP_STRING
+        return None
+
+    def ends_turn(self, token: int) -> bool:
+        return token == self.eos_token_id or token in self.turn_end_ids
+
+    def first_stop(self, tokens: List[int]) -> Optional[int]:
+        for i, token in enumerate(tokens):
+            if self.match(token):
+                return i
+        return None
+
+    def __call__(self, request, now: float) -> Optional[str]:
+        if request.generated:
+            reason = self.match(request.generated[-1])
+            if reason:
+                return reason
+        if len(request.generated) >= request.max_new_tokens:
+            return MAX_TOKENS
+        if request.cancelled.is_set():
+            return CANCELLED
+        if now > request.deadline:
+            return DEADLINE
+        return None
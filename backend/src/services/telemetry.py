@@ -0,0 +1,142 @@
+import logging
+import queue
+import time
+from threading import Thread, Event, Lock
+from typing import List, Dict, Tuple
+from src.config import settings
+from src.db.mongo_client import get_db
+
+logger = logging.getLogger(__name__)
+
+MLFLOW_BATCH_LIMIT = 1000
+
+
+class TelemetrySink:
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float, mlflow_enabled: bool,
+                 name: str = "telemetry-sink"):
+        self.name = name
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.mlflow_enabled = mlflow_enabled
+        self.counters = {"enqueued": 0, "dropped": 0, "written": 0, "write_errors": 0, "mlflow_errors": 0}
+        self._counters_lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+        self._mlflow_client = None
+        self._mlflow_run_id = None
+        self._step = 0
+
+    def enqueue(self, collection: str, document: dict, metrics: Dict[str, float] = None) -> bool:
+        try:
+            self.queue.put_nowait((collection, document, metrics or {}))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("enqueued")
+        return True
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+        self._end_mlflow_run()
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return {**self.counters, "queued": self.queue.qsize()}
+
+    def _count(self, key: str, value: int = 1):
+        with self._counters_lock:
+            self.counters[key] += value
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._drain(time.monotonic() + self.flush_interval)
+            if batch:
+                self._flush(batch)
+        while True:
+            batch = self._drain(time.monotonic())
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _drain(self, deadline: float) -> List[Tuple]:
+        batch = []
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0 and not self._stopped.is_set():
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[Tuple]):
+        by_collection = {}
+        for collection, document, _ in batch:
+            by_collection.setdefault(collection, []).append(document)
+        db = get_db()
+        for collection, documents in by_collection.items():
+            try:
+                db[collection].insert_many(documents, ordered=False)
+                self._count("written", len(documents))
+            except Exception as e:
+                self._count("write_errors", len(documents))
+                logger.error(f"Telemetry write to {collection} failed: {str(e)}")
+        if self.mlflow_enabled:
+            self._log_mlflow(batch)
+
+    def _log_mlflow(self, batch: List[Tuple]):
+        try:
+            from mlflow.entities import Metric
+            client, run_id = self._mlflow_run()
+            metrics = []
+            timestamp = int(time.time() * 1000)
+            for _, _, values in batch:
+                self._step += 1
+                for key, value in values.items():
+                    metrics.append(Metric(key, float(value or 0), timestamp, self._step))
+            for start in range(0, len(metrics), MLFLOW_BATCH_LIMIT):
+                client.log_batch(run_id, metrics=metrics[start:start + MLFLOW_BATCH_LIMIT])
+        except Exception as e:
+            self._count("mlflow_errors")
+            logger.error(f"Telemetry MLflow logging failed: {str(e)}")
+
+    def _mlflow_run(self):
+        if self._mlflow_run_id is None:
+            import mlflow
+            from mlflow.tracking import MlflowClient
+            experiment = mlflow.set_experiment(settings.MLFLOW_EXPERIMENT_NAME)
+            self._mlflow_client = MlflowClient()
+            run = self._mlflow_client.create_run(experiment.experiment_id, run_name="neurochat-telemetry")
+            self._mlflow_run_id = run.info.run_id
+        return self._mlflow_client, self._mlflow_run_id
+
+    def _end_mlflow_run(self):
+        if self._mlflow_run_id is None:
+            return
+        try:
+            self._mlflow_client.set_terminated(self._mlflow_run_id)
+        except Exception as e:
+            logger.error(f"Telemetry MLflow run could not be closed: {str(e)}")
+        self._mlflow_run_id = None
+
+
+telemetry_sink = TelemetrySink(
+    max_queue=settings.TELEMETRY_QUEUE_SIZE,
+    batch_size=settings.TELEMETRY_BATCH_SIZE,
+    flush_interval=settings.TELEMETRY_FLUSH_INTERVAL,
+    mlflow_enabled=settings.TELEMETRY_MLFLOW_ENABLED
+)
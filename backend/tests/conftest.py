@@ -0,0 +1,115 @@
+import os
+import sys
+
+os.environ["MONGO_URI"] = "mongomock://tests"
+os.environ["AUTH_BCRYPT_ROUNDS"] = "4"
+os.environ["MODEL_LOAD_ON_STARTUP"] = "false"
+os.environ["TELEMETRY_MLFLOW_ENABLED"] = "false"
+os.environ["ADMISSION_BURST"] = "1000"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import pytest
+
+from benchmarks.chat_load import StubProcessor, install_stub_model
+from src.db import mongo_client
+from src.db.mongo_client import get_async_db
+from src.main import app
+from src.services import auth_service, chat_service, llm_service
+from src.services.admission import admission
+from src.services.llm_scheduler import BatchScheduler
+from tiny_model import EOS_ID, PAD_ID, build_model
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def hash_pool():
+    yield
+    auth_service.shutdown_hash_pool()
+
+
+@pytest.fixture(scope="session")
+def model():
+    return build_model(layers=2, seed=0)
+
+
+@pytest.fixture(scope="session")
+def draft(model):
+    draft = build_model(layers=1, seed=1)
+    draft.model.embed_tokens.weight.data.copy_(model.model.embed_tokens.weight.data)
+    draft.lm_head.weight.data.copy_(model.lm_head.weight.data)
+    return draft
+
+
+@pytest.fixture
+def make_scheduler(model):
+    schedulers = []
+
+    def make(prefix_cache=None, speculator=None, max_batch_size=4):
+        scheduler = BatchScheduler(
+            model, eos_token_id=EOS_ID, pad_token_id=PAD_ID, device="cpu", max_batch_size=max_batch_size,
+            max_wait=0.05, request_timeout=60, prefix_cache=prefix_cache, speculator=speculator
+        )
+        scheduler.start()
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+@pytest.fixture
+def stub_model():
+    processor = StubProcessor(tokens=3, token_delay=0.0)
+    install_stub_model(processor)
+    yield processor
+    llm_service._processor = None
+    llm_service._load_future = None
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    mongo_client.close_clients()
+    auth_service.principal_cache.entries.clear()
+    auth_service.principal_cache.revoked.clear()
+    chat_service.context_windows.windows.clear()
+    admission.buckets.clear()
+    admission.waiting.clear()
+    admission.active = admission.queued = 0
+    yield
+    mongo_client.close_clients()
+
+
+@pytest.fixture
+async def client(stub_model):
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    chat_service.message_writer.start()
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+    chat_service.message_writer.stop()
+
+
+@pytest.fixture
+def register(client):
+    async def register(username: str = "ivan", password: str = "secret") -> dict:
+        response = await client.post("/api/auth/register", json={
+            "username": username, "email": f"{username}@example.com", "password": password
+        })
+        assert response.status_code == 200, response.text
+        response = await client.post("/api/auth/login", data={"username": username, "password": password})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return register
+
+
+@pytest.fixture
+def stored_messages():
+    async def stored_messages(session_id: str) -> list:
+        cursor = get_async_db().Messages.find({"session_id": session_id}).sort("timestamp", 1)
+        return await cursor.to_list(length=None)
+    return stored_messages
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from src.db.mongo_client import get_async_db
+from src.services.admission import admission
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_admission_rate_limit(client, register, monkeypatch):
+    headers = await register()
+    monkeypatch.setattr(admission, "burst", 1)
+    first = await client.post("/api/chat/message", json={"role": "user", "content": "one"}, headers=headers)
+    second = await client.post("/api/chat/message", json={"role": "user", "content": "two"}, headers=headers)
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert int(second.headers["Retry-After"]) >= 1
+    assert await get_async_db().Messages.count_documents({"content": "two"}) == 0
+
+
+async def test_admission_queue_full(client, register, stub_model, monkeypatch):
+    headers = await register()
+    monkeypatch.setattr(stub_model, "token_delay", 0.05)
+    monkeypatch.setattr(admission, "max_active", 1)
+    monkeypatch.setattr(admission, "max_queue", 0)
+
+    async def send(content: str):
+        return await client.post("/api/chat/message", json={"role": "user", "content": content}, headers=headers)
+
+    first = asyncio.ensure_future(send("first"))
+    await asyncio.sleep(0.05)
+    second = await send("second")
+    assert second.status_code == 503
+    assert int(second.headers["Retry-After"]) >= 1
+    assert (await first).status_code == 200
+    assert admission.stats()["active"] == 0
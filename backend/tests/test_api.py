@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def _events(body: str) -> list:
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+
+async def test_register_login_and_me(client, register):
+    headers = await register("ivan")
+    response = await client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["username"] == "ivan"
+    assert response.json()["email"] == "ivan@example.com"
+
+
+async def test_register_duplicate_user(client, register):
+    await register("ivan")
+    response = await client.post("/api/auth/register", json={
+        "username": "ivan", "email": "other@example.com", "password": "secret"
+    })
+    assert response.status_code == 400
+
+
+async def test_login_wrong_password(client, register):
+    await register("ivan")
+    response = await client.post("/api/auth/login", data={"username": "ivan", "password": "wrong"})
+    assert response.status_code == 400
+
+
+async def test_message_round_trip(client, register):
+    headers = await register()
+    response = await client.post("/api/chat/message", json={"role": "user", "content": "hello there"},
+                                 headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["bot_content"] == "hello there hello"
+
+    response = await client.post("/api/chat/message", json={
+        "role": "user", "content": "second question", "session_id": body["session_id"]
+    }, headers=headers)
+    assert response.status_code == 200
+
+    response = await client.get(f"/api/chat/session/{body['session_id']}", headers=headers)
+    assert response.status_code == 200
+    history = response.json()
+    assert [(m["role"], m["content"]) for m in history["messages"]] == [
+        ("user", "hello there"), ("assistant", "hello there hello"),
+        ("user", "second question"), ("assistant", "second question second"),
+    ]
+    assert history["next_cursor"] is None
+
+
+async def test_stream_round_trip(client, register, stored_messages):
+    headers = await register()
+    response = await client.post("/api/chat/message/stream", json={"role": "user", "content": "stream me"},
+                                 headers=headers)
+    assert response.status_code == 200
+    events = _events(response.text)
+    assert events[0]["type"] == "session"
+    assert "".join(e["content"] for e in events if e["type"] == "token") == "stream me stream"
+    assert events[-1]["type"] == "done"
+    assert events[-1]["bot_content"] == "stream me stream"
+
+    messages = await stored_messages(events[0]["session_id"])
+    assert [(m["role"], m["content"]) for m in messages] == [("user", "stream me"), ("assistant", "stream me stream")]
+
+
+async def test_session_of_another_user(client, register):
+    owner = await register("owner")
+    other = await register("other")
+    response = await client.post("/api/chat/message", json={"role": "user", "content": "private"}, headers=owner)
+    session_id = response.json()["session_id"]
+
+    response = await client.get(f"/api/chat/session/{session_id}", headers=other)
+    assert response.status_code == 404
+    response = await client.post("/api/chat/message", json={
+        "role": "user", "content": "intrude", "session_id": session_id
+    }, headers=other)
+    assert response.status_code == 404
+
+
+async def test_runtime_stats(client):
+    response = await client.get("/api/monitoring/runtime")
+    assert response.status_code == 200
+    assert response.json()["model"] == "ready"
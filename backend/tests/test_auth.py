@@ -0,0 +1,25 @@
+import pytest
+
+from src.services import auth_service
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_deleted_account_token_rejected(client, register):
+    headers = await register("ivan")
+    assert (await client.get("/api/auth/me", headers=headers)).status_code == 200
+    assert "ivan" in auth_service.principal_cache.entries
+
+    response = await client.delete("/api/auth/delete", headers=headers)
+    assert response.status_code == 200
+    assert "ivan" not in auth_service.principal_cache.entries
+    assert (await client.get("/api/auth/me", headers=headers)).status_code == 404
+
+
+async def test_deleted_account_trusted_claims_revoked(client, register, monkeypatch):
+    monkeypatch.setattr(auth_service, "AUTH_TRUST_TOKEN_CLAIMS", True)
+    headers = await register("ivan")
+    assert (await client.get("/api/auth/me", headers=headers)).status_code == 200
+
+    await client.delete("/api/auth/delete", headers=headers)
+    assert (await client.get("/api/auth/me", headers=headers)).status_code == 401
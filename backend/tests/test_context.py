@@ -0,0 +1,38 @@
+import pytest
+
+from src.config import settings
+from src.db.mongo_client import get_async_db
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_prompt_has_no_holes_between_summary_and_turns(client, register, stub_model, monkeypatch):
+    headers = await register()
+    monkeypatch.setattr(settings, "CONTEXT_MAX_TURNS", 8)
+    monkeypatch.setattr(settings, "CONTEXT_MAX_TOKENS", 60)
+    monkeypatch.setattr(settings, "SUMMARY_MAX_TOKENS", 10)
+    prompts, expected = [], []
+    agenerate_response = stub_model.agenerate_response
+
+    async def recording_generate(messages, use_cache=True):
+        db = get_async_db()
+        session = await db.Sessions.find_one({"session_id": session_id}) if session_id else None
+        until = ((session or {}).get("summary") or {}).get("until")
+        query = {"session_id": session_id, **({"timestamp": {"$gt": until}} if until else {})}
+        stored = await db.Messages.find(query).sort("timestamp", 1).to_list(length=None)
+        prompts.append([m["content"] for m in messages if m["role"] != "system"])
+        expected.append([m["content"] for m in stored] + [messages[-1]["content"]])
+        return await agenerate_response(messages, use_cache)
+
+    monkeypatch.setattr(stub_model, "agenerate_response", recording_generate)
+    session_id = None
+    for i in range(12):
+        response = await client.post("/api/chat/message", json={
+            "role": "user", "content": f"w{i} x y", **({"session_id": session_id} if session_id else {})
+        }, headers=headers)
+        assert response.status_code == 200
+        session_id = response.json()["session_id"]
+
+    assert prompts == expected
+    session = await get_async_db().Sessions.find_one({"session_id": session_id})
+    assert session["summary"]["until"]
@@ -0,0 +1,24 @@
+import pytest
+from prometheus_client import REGISTRY
+
+pytestmark = pytest.mark.anyio
+
+STREAM_LABELS = {"method": "POST", "route": "/api/chat/message/stream", "status": "200"}
+
+
+def _sample(name: str, labels: dict) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+async def test_stream_latency_covers_the_body(client, register, stub_model, monkeypatch):
+    headers = await register()
+    monkeypatch.setattr(stub_model, "token_delay", 0.1)
+    before = _sample("neurochat_http_request_duration_seconds_sum", STREAM_LABELS)
+
+    response = await client.post("/api/chat/message/stream", json={"role": "user", "content": "slow stream"},
+                                  headers=headers)
+    assert response.status_code == 200
+
+    elapsed = _sample("neurochat_http_request_duration_seconds_sum", STREAM_LABELS) - before
+    assert elapsed >= stub_model.tokens * stub_model.token_delay
+    assert _sample("neurochat_http_requests_in_progress", {"method": "POST"}) == 0
@@ -0,0 +1,58 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_history_pagination(client, register, stored_messages):
+    headers = await register()
+    response = await client.post("/api/chat/message", json={"role": "user", "content": "q0"}, headers=headers)
+    session_id = response.json()["session_id"]
+    for i in range(1, 3):
+        await client.post("/api/chat/message", json={"role": "user", "content": f"q{i}", "session_id": session_id},
+                          headers=headers)
+    expected = [m["content"] for m in await stored_messages(session_id)]
+    assert len(expected) == 6
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 4, **({"cursor": cursor} if cursor else {})}
+        response = await client.get(f"/api/chat/session/{session_id}", params=params, headers=headers)
+        assert response.status_code == 200
+        page = response.json()
+        pages.insert(0, [m["content"] for m in page["messages"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [2, 4]
+    assert sum(pages, []) == expected
+
+
+async def test_session_list_pagination(client, register):
+    headers = await register()
+    created = []
+    for i in range(3):
+        response = await client.post("/api/chat/message", json={"role": "user", "content": f"topic {i}"},
+                                     headers=headers)
+        created.append(response.json()["session_id"])
+
+    response = await client.get("/api/chat/sessions", params={"limit": 2}, headers=headers)
+    first = response.json()
+    assert len(first["sessions"]) == 2
+    response = await client.get("/api/chat/sessions", params={"limit": 2, "cursor": first["next_cursor"]},
+                                headers=headers)
+    second = response.json()
+    assert second["next_cursor"] is None
+    listed = [s["session_id"] for s in first["sessions"] + second["sessions"]]
+    assert listed == created[::-1]
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "bm90LWEtY3Vyc29y"])
+async def test_bad_cursor(client, register, cursor):
+    headers = await register()
+    response = await client.post("/api/chat/message", json={"role": "user", "content": "hi"}, headers=headers)
+    session_id = response.json()["session_id"]
+
+    response = await client.get(f"/api/chat/session/{session_id}", params={"cursor": cursor}, headers=headers)
+    assert response.status_code == 400
+    response = await client.get("/api/chat/sessions", params={"cursor": cursor}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from src.config import settings
+from src.services import chat_service, message_writer as message_writer_module
+from src.services.admission import admission
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def write_behind(client, monkeypatch):
+    writer = chat_service.message_writer
+    writer.stop()
+    monkeypatch.setattr(settings, "CHAT_PERSISTENCE_MODE", "write_behind")
+    monkeypatch.setattr(writer, "retry_interval", 0.01)
+    yield writer
+    writer.stop()
+    writer.pending.clear()
+
+
+async def _flushed(writer):
+    for _ in range(200):
+        if not writer.pending:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"write-behind queue not flushed: {writer.stats()}")
+
+
+def _recorder(stub_model, monkeypatch) -> list:
+    prompts = []
+    agenerate_response = stub_model.agenerate_response
+
+    async def recording_generate(messages, use_cache=True):
+        prompts.append([m["content"] for m in messages])
+        return await agenerate_response(messages, use_cache)
+
+    monkeypatch.setattr(stub_model, "agenerate_response", recording_generate)
+    return prompts
+
+
+async def test_turn_persisted_in_one_write(client, register, stored_messages, monkeypatch):
+    headers = await register()
+    calls = []
+    persist_turn = chat_service.persist_turn
+
+    async def counting_persist_turn(turn):
+        calls.append([m["role"] for m in turn.messages])
+        await persist_turn(turn)
+
+    monkeypatch.setattr(chat_service, "persist_turn", counting_persist_turn)
+    response = await client.post("/api/chat/message", json={"role": "user", "content": "one write"},
+                                 headers=headers)
+    session_id = response.json()["session_id"]
+
+    assert calls == [["user", "assistant"]]
+    messages = await stored_messages(session_id)
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+    assert messages[0]["timestamp"] <= messages[1]["timestamp"]
+    chat_service.message_writer.stop()
+    session = await chat_service.get_session(session_id)
+    assert session["last_message_at"] == messages[1]["timestamp"]
+
+
+@pytest.mark.parametrize("mode, expected", [
+    ("sync", [("Sessions", "find_one"), ("Messages", "insert_many")]),
+    ("write_behind", [("Sessions", "find_one")]),
+])
+async def test_turn_round_trips(client, register, monkeypatch, mode, expected):
+    headers = await register()
+    response = await client.post("/api/chat/message", json={"role": "user", "content": "first"}, headers=headers)
+    session_id = response.json()["session_id"]
+    monkeypatch.setattr(settings, "CHAT_PERSISTENCE_MODE", mode)
+    get_async_db, calls = chat_service.get_async_db, []
+
+    class Collection:
+        def __init__(self, name):
+            self.name = name
+
+        def __getattr__(self, op):
+            calls.append((self.name, op))
+            return getattr(get_async_db()[self.name], op)
+
+    class Database:
+        def __getattr__(self, name):
+            return Collection(name)
+
+    monkeypatch.setattr(chat_service, "get_async_db", Database)
+    response = await client.post("/api/chat/message", json={
+        "role": "user", "content": "second", "session_id": session_id
+    }, headers=headers)
+    assert response.status_code == 200
+    assert calls == expected
+
+
+async def test_failed_generation_persists_nothing(client, register, stub_model, stored_messages, monkeypatch):
+    headers = await register()
+    response = await client.post("/api/chat/message", json={"role": "user", "content": "first"}, headers=headers)
+    session_id = response.json()["session_id"]
+
+    async def failing_generate(messages, use_cache=True):
+        raise RuntimeError("model crashed")
+
+    def failing_stream(messages, use_cache=True):
+        yield "partial"
+        raise RuntimeError("model crashed")
+
+    monkeypatch.setattr(stub_model, "agenerate_response", failing_generate)
+    monkeypatch.setattr(stub_model, "stream_response", failing_stream)
+    response = await client.post("/api/chat/message", json={
+        "role": "user", "content": "lost", "session_id": session_id
+    }, headers=headers)
+    assert response.status_code == 503
+    response = await client.post("/api/chat/message/stream", json={
+        "role": "user", "content": "lost", "session_id": session_id
+    }, headers=headers)
+    assert response.status_code == 200
+    assert '"type": "error"' in response.text
+    assert '"type": "done"' not in response.text
+
+    assert [m["content"] for m in await stored_messages(session_id)] == ["first", "first first first"]
+    window = chat_service.context_windows.get(session_id)
+    assert [turn["content"] for turn in window] == ["first", "first first first"]
+    assert admission.stats()["active"] == 0
+
+
+async def test_write_behind_reload_keeps_queued_turns(client, register, stub_model, stored_messages,
+                                                      write_behind, monkeypatch):
+    headers = await register()
+    prompts = _recorder(stub_model, monkeypatch)
+    response = await client.post("/api/chat/message", json={"role": "user", "content": "one"}, headers=headers)
+    session_id = response.json()["session_id"]
+    assert await stored_messages(session_id) == []
+
+    chat_service.context_windows.drop(session_id)
+    await client.post("/api/chat/message", json={"role": "user", "content": "two", "session_id": session_id},
+                      headers=headers)
+    write_behind.start()
+    await _flushed(write_behind)
+    await client.post("/api/chat/message", json={"role": "user", "content": "three", "session_id": session_id},
+                      headers=headers)
+
+    assert prompts[-1] == ["one", "one one one", "two", "two two two", "three"]
+    write_behind.stop()
+    messages = await stored_messages(session_id)
+    assert [m["content"] for m in messages] == [
+        "one", "one one one", "two", "two two two", "three", "three three three"
+    ]
+    session = await chat_service.get_session(session_id)
+    assert session["last_message_at"] == messages[-1]["timestamp"]
+
+
+async def test_write_behind_retries_failed_flush(client, register, stub_model, stored_messages,
+                                                 write_behind, monkeypatch):
+    headers = await register()
+    get_db, failures = message_writer_module.get_db, []
+
+    def flaky_get_db():
+        if not failures:
+            failures.append(1)
+            raise ConnectionError("mongo unavailable")
+        return get_db()
+
+    monkeypatch.setattr(message_writer_module, "get_db", flaky_get_db)
+    retries = write_behind.stats()["retries"]
+    write_behind.start()
+    response = await client.post("/api/chat/message", json={"role": "user", "content": "kept"}, headers=headers)
+    session_id = response.json()["session_id"]
+    await _flushed(write_behind)
+
+    assert write_behind.stats()["retries"] == retries + 1
+    assert [m["content"] for m in await stored_messages(session_id)] == ["kept", "kept kept kept"]
@@ -0,0 +1,100 @@
+import torch
+
+from src.services.prefix_cache import PrefixCache
+from tiny_model import HEADER, generate, random_ids, reference_ids
+
+
+def _past(length: int, layers: int = 2) -> tuple:
+    return tuple((torch.zeros(1, 1, length, 4), torch.zeros(1, 1, length, 4)) for _ in range(layers))
+
+
+def _nbytes(length: int) -> int:
+    return length * 4 * 4 * 2 * 2
+
+
+def test_lookup_longest_prefix():
+    cache = PrefixCache(max_entries=8, max_bytes=1 << 20)
+    cache.store([1, 2], _past(2))
+    cache.store([1, 2, 3, 4], _past(4))
+
+    reused, past = cache.lookup([1, 2, 3, 4, 5])
+    assert reused == 4
+    assert past[0][0].shape[2] == 4
+    assert cache.lookup([1, 2, 9])[0] == 2
+    assert cache.lookup([1, 2, 3, 4])[0] == 2
+    assert cache.lookup([7, 8, 9]) == (0, None)
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["tokens_reused"]) == (3, 1, 8)
+
+
+def test_store_copies_tensors():
+    cache = PrefixCache(max_entries=8, max_bytes=1 << 20)
+    past = _past(3)
+    cache.store([1, 2, 3], past)
+    past[0][0].fill_(1)
+    assert float(cache.lookup([1, 2, 3, 4])[1][0][0].sum()) == 0
+
+
+def test_discard_keeps_pinned():
+    cache = PrefixCache(max_entries=8, max_bytes=1 << 20)
+    cache.store([1, 2], _past(2), pinned=True)
+    cache.store([1, 2, 3], _past(3))
+
+    cache.discard([1, 2, 3])
+    cache.discard([1, 2])
+    cache.discard([9])
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([1, 2, 3, 4])[0] == 2
+    assert cache.stats()["bytes"] == _nbytes(2)
+
+
+def test_evicts_least_recent_unpinned():
+    cache = PrefixCache(max_entries=2, max_bytes=1 << 20)
+    cache.store([1], _past(1), pinned=True)
+    cache.store([2, 2], _past(2))
+    cache.store([3, 3, 3], _past(3))
+
+    assert cache.lookup([1, 0])[0] == 1
+    assert cache.lookup([2, 2, 0])[0] == 0
+    assert cache.lookup([3, 3, 3, 0])[0] == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_budget():
+    cache = PrefixCache(max_entries=8, max_bytes=_nbytes(5))
+    cache.store(list(range(6)), _past(6))
+    assert cache.stats()["entries"] == 0
+
+    cache.store([1, 2, 3], _past(3))
+    cache.store([4, 5, 6], _past(3))
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] == _nbytes(3)
+    assert cache.lookup([4, 5, 6, 7])[0] == 3
+
+
+def test_prefix_cache_matches_generate(model, make_scheduler):
+    cache = PrefixCache(max_entries=16, max_bytes=64 * 1024 * 1024)
+    scheduler = make_scheduler(prefix_cache=cache)
+    system = random_ids(12, seed=10)
+    first = system + random_ids(6, seed=11) + HEADER
+
+    def cache_points(input_ids):
+        return [(len(system), True), (len(input_ids) - len(HEADER), False)]
+
+    request = generate(scheduler, first, cache_points=cache_points(first))
+    assert request.generated == reference_ids(model, first)
+
+    second = first + request.generated + random_ids(5, seed=12) + HEADER
+    request = generate(scheduler, second, cache_points=cache_points(second))
+    assert request.generated == reference_ids(model, second)
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["tokens_reused"] == len(first) - len(HEADER)
+    assert sorted(len(entry.tokens) for entry in cache.entries.values()) == [len(system), len(second) - len(HEADER)]
+
+    other = system + random_ids(9, seed=13)
+    assert generate(scheduler, other).generated == reference_ids(model, other)
+    assert cache.stats()["tokens_reused"] == len(first) - len(HEADER) + len(system)
@@ -0,0 +1,9 @@
+from tiny_model import SAMPLING, random_ids, reference_ids
+
+
+def test_greedy_matches_generate(model, make_scheduler):
+    scheduler = make_scheduler()
+    prompts = [random_ids(length, seed) for seed, length in enumerate((5, 11, 17, 8))]
+    requests = [scheduler.submit(prompt, SAMPLING) for prompt in prompts]
+    for prompt, request in zip(prompts, requests):
+        assert request.future.result(timeout=60) == reference_ids(model, prompt)
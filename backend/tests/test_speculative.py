@@ -0,0 +1,14 @@
+from src.services.speculative import SpeculativeDecoder
+from tiny_model import VOCAB_SIZE, generate, random_ids, reference_ids
+
+
+def test_speculative_matches_generate(model, draft, make_scheduler):
+    speculator = SpeculativeDecoder(draft, lookahead=4, vocab_size=VOCAB_SIZE, device="cpu")
+    scheduler = make_scheduler(speculator=speculator)
+    for seed, length in enumerate((6, 13, 9)):
+        prompt = random_ids(length, seed=20 + seed)
+        assert generate(scheduler, prompt).generated == reference_ids(model, prompt)
+    stats = speculator.stats()
+    assert stats["steps"] > 0
+    assert stats["accepted"] > 0
+    assert stats["tokens_per_step"] > 1
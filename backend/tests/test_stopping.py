@@ -0,0 +1,86 @@
+import time
+from threading import Event
+from types import SimpleNamespace
+
+import pytest
+
+from src.services.speculative import SpeculativeDecoder
+from src.services.stopping import (
+    CANCELLED, DEADLINE, EOS, MAX_TOKENS, STOP_STRING, TURN_END, StoppingCriteria
+)
+from tiny_model import EOS_ID, SAMPLING, VOCAB_SIZE, generate, random_ids, reference_ids
+
+STOPPING = StoppingCriteria(0, turn_end_ids=frozenset({1}), stop_token_ids=frozenset({1, 2}))
+
+
+def _request(generated, max_new_tokens=8, cancelled=False, deadline=None):
+    request = SimpleNamespace(generated=generated, max_new_tokens=max_new_tokens, cancelled=Event(),
+                              deadline=deadline if deadline is not None else time.monotonic() + 60)
+    if cancelled:
+        request.cancelled.set()
+    return request
+
+
+def test_match():
+    assert STOPPING.match(0) == EOS
+    assert STOPPING.match(1) == TURN_END
+    assert STOPPING.match(2) == STOP_STRING
+    assert STOPPING.match(3) is None
+    assert STOPPING.stop_token_ids == frozenset({2})
+
+
+def test_ends_turn():
+    assert STOPPING.ends_turn(0)
+    assert STOPPING.ends_turn(1)
+    assert not STOPPING.ends_turn(2)
+
+
+def test_first_stop():
+    assert STOPPING.first_stop([5, 6, 2, 0]) == 2
+    assert STOPPING.first_stop([5, 6]) is None
+
+
+def test_call_reasons():
+    now = time.monotonic()
+    assert STOPPING(_request([]), now) is None
+    assert STOPPING(_request([4, 5]), now) is None
+    assert STOPPING(_request([4, 1]), now) == TURN_END
+    assert STOPPING(_request([4] * 8), now) == MAX_TOKENS
+    assert STOPPING(_request([4, 2], max_new_tokens=2), now) == STOP_STRING
+    assert STOPPING(_request([4], cancelled=True), now) == CANCELLED
+    assert STOPPING(_request([4], deadline=now - 1), now) == DEADLINE
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+@pytest.mark.parametrize("kind, reason", [("eos", EOS), ("turn_end", TURN_END), ("stop", STOP_STRING)])
+def test_early_stop(model, draft, make_scheduler, speculative, kind, reason):
+    speculator = SpeculativeDecoder(draft, lookahead=4, vocab_size=VOCAB_SIZE, device="cpu") if speculative else None
+    scheduler = make_scheduler(speculator=speculator)
+    prompt = random_ids(10, seed=30)
+    reference = reference_ids(model, prompt)
+    position = next(i for i in range(5, len(reference)) if reference[i] not in reference[:i])
+    token = reference[position]
+
+    stopping = {
+        "eos": StoppingCriteria(token),
+        "turn_end": StoppingCriteria(EOS_ID, turn_end_ids=frozenset({token})),
+        "stop": StoppingCriteria(EOS_ID, stop_token_ids=frozenset({token})),
+    }[kind]
+    request = generate(scheduler, prompt, stopping=stopping)
+
+    kept = position + 1 if reason == STOP_STRING else position
+    assert request.generated == reference[:kept]
+    assert request.stop_reason == reason
+    timings = request.timings()
+    assert timings["stop_reason"] == reason
+    assert timings["tokens"] == kept
+    assert timings["tokens_saved"] == SAMPLING["max_new_tokens"] - kept
+
+
+def test_max_tokens_saves_nothing(model, make_scheduler):
+    scheduler = make_scheduler()
+    prompt = random_ids(10, seed=30)
+    request = generate(scheduler, prompt, stopping=StoppingCriteria(EOS_ID))
+    assert len(request.generated) == SAMPLING["max_new_tokens"]
+    assert request.stop_reason == MAX_TOKENS
+    assert request.timings()["tokens_saved"] == 0
@@ -0,0 +1,40 @@
+import torch
+from transformers import Qwen2Config, Qwen2ForCausalLM
+
+VOCAB_SIZE = 96
+EOS_ID = 0
+PAD_ID = 1
+HEADER = [5, 6, 7]
+SAMPLING = {"max_new_tokens": 24, "do_sample": False, "repetition_penalty": 1.2}
+
+
+def build_model(layers: int, seed: int) -> Qwen2ForCausalLM:
+    torch.manual_seed(seed)
+    config = Qwen2Config(
+        vocab_size=VOCAB_SIZE, hidden_size=32, intermediate_size=64, num_hidden_layers=layers,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+        eos_token_id=EOS_ID, pad_token_id=PAD_ID
+    )
+    return Qwen2ForCausalLM(config).eval()
+
+
+def random_ids(length: int, seed: int) -> list:
+    generator = torch.Generator().manual_seed(seed)
+    return torch.randint(2, VOCAB_SIZE, (length,), generator=generator).tolist()
+
+
+def reference_ids(model, input_ids: list, sampling: dict = SAMPLING) -> list:
+    with torch.inference_mode():
+        output = model.generate(
+            torch.tensor([input_ids]), attention_mask=torch.ones((1, len(input_ids)), dtype=torch.long),
+            max_new_tokens=sampling["max_new_tokens"], do_sample=False,
+            repetition_penalty=sampling["repetition_penalty"], eos_token_id=EOS_ID, pad_token_id=PAD_ID
+        )
+    generated = output[0, len(input_ids):].tolist()
+    return generated[:generated.index(EOS_ID)] if EOS_ID in generated else generated
+
+
+def generate(scheduler, input_ids: list, **kwargs):
+    request = scheduler.submit(input_ids, SAMPLING, **kwargs)
+    request.future.result(timeout=60)
+    return request
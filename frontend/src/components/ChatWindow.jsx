@@ -1,6 +1,6 @@
 // ChatWindow.jsx
 import React, { useRef, useEffect, useState } from 'react';
-import { Box, Typography, Avatar, IconButton, Tooltip } from '@mui/material';
+import { Box, Typography, Avatar, IconButton, Tooltip, Button } from '@mui/material';
 import { motion, AnimatePresence } from 'framer-motion';
 import styled from '@emotion/styled';
 import ContentCopyIcon from '@mui/icons-material/ContentCopy';
@@ -161,8 +161,9 @@ const MessageContent = ({ msg }) => {
   return <AnimatedText text={msg.content} />;
 };
 
-const ChatWindow = ({ messages, username }) => {
+const ChatWindow = ({ messages, username, hasOlder, onLoadOlder }) => {
   const containerRef = useRef(null);
+  const lastMessage = messages[messages.length - 1];
 
   useEffect(() => {
     if (containerRef.current) {
@@ -171,7 +172,7 @@ const ChatWindow = ({ messages, username }) => {
         behavior: 'smooth'
       });
     }
-  }, [messages]);
+  }, [lastMessage]);
 
   return (
     <Box ref={containerRef} sx={{
@@ -185,6 +186,13 @@ const ChatWindow = ({ messages, username }) => {
         borderRadius: '3px',
       },
     }}>
+      {hasOlder && (
+        <Box sx={{ display: 'flex', justifyContent: 'center', mb: 2 }}>
+          <Button onClick={onLoadOlder} size="small" sx={{ color: '#00ff88' }}>
+            Загрузить предыдущие сообщения
+          </Button>
+        </Box>
+      )}
       <AnimatePresence initial={false}>
         {messages.map((msg, idx) => (
           <MessageBubble
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { Box, Typography, List, Avatar, IconButton, Tooltip, Divider } from '@mui/material';
+import { Box, Typography, List, Avatar, IconButton, Tooltip, Divider, Button } from '@mui/material';
 import { styled } from '@mui/material/styles';
 import { motion, AnimatePresence } from 'framer-motion';
 import axios from 'axios';
@@ -51,6 +51,7 @@ const SessionsHeader = styled(Typography)(({ theme }) => ({
 
 const SessionSidebar = ({ activeSessionId, onSessionSelect }) => {
   const [sessions, setSessions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [userInfo, setUserInfo] = useState({});
   const navigate = useNavigate();
   const accessToken = localStorage.getItem('access_token');
@@ -69,6 +70,7 @@ const SessionSidebar = ({ activeSessionId, onSessionSelect }) => {
 
         setUserInfo(userRes.data);
         setSessions(sessionsRes.data.sessions);
+        setNextCursor(sessionsRes.data.next_cursor);
       } catch (err) {
         console.error(err);
       }
@@ -76,6 +78,19 @@ const SessionSidebar = ({ activeSessionId, onSessionSelect }) => {
     fetchData();
   }, [accessToken]);
 
+  const handleLoadMore = async () => {
+    try {
+      const { data } = await axios.get('http://localhost:8000/api/chat/sessions', {
+        headers: { Authorization: `Bearer ${accessToken}` },
+        params: { cursor: nextCursor },
+      });
+      setSessions(prev => [...prev, ...data.sessions]);
+      setNextCursor(data.next_cursor);
+    } catch (err) {
+      console.error(err);
+    }
+  };
+
   const handleNewSession = async () => {
     try {
       const { data } = await axios.post('http://localhost:8000/api/chat/session', {}, {
@@ -175,6 +190,13 @@ const SessionSidebar = ({ activeSessionId, onSessionSelect }) => {
             </SessionItem>
           ))}
         </AnimatePresence>
+        {nextCursor && (
+          <Box sx={{ display: 'flex', justifyContent: 'center', mt: 1 }}>
+            <Button onClick={handleLoadMore} size="small" sx={{ color: '#00ff88' }}>
+              Показать ещё
+            </Button>
+          </Box>
+        )}
       </List>
 
       <Divider sx={{ my: 2, borderColor: 'rgba(255,255,255,0.2)' }} />
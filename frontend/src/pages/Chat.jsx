@@ -38,6 +38,7 @@ const Chat = () => {
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
   const [userInfo, setUserInfo] = useState({});
+  const [olderCursor, setOlderCursor] = useState(null);
   const accessToken = localStorage.getItem('access_token');
   const navigate = useNavigate();
 
@@ -65,25 +66,41 @@ const Chat = () => {
     }
   }, [accessToken]);
 
+  const fetchHistory = (cursor) =>
+    axios.get(`http://localhost:8000/api/chat/session/${sessionId}`, {
+      headers: { Authorization: `Bearer ${accessToken}` },
+      params: cursor ? { cursor } : {},
+    });
+
+  const toHistoric = (data) => data.messages.map(msg => ({
+    ...msg,
+    isNew: false
+  }));
+
   useEffect(() => {
     if (sessionId) {
       setIsLoading(true);
-      axios
-        .get(`http://localhost:8000/api/chat/session/${sessionId}`, {
-          headers: { Authorization: `Bearer ${accessToken}` },
-        })
+      setOlderCursor(null);
+      fetchHistory()
         .then((res) => {
-          const historicMessages = res.data.messages.map(msg => ({
-            ...msg,
-            isNew: false
-          }));
-          setMessages(historicMessages);
+          setMessages(toHistoric(res.data));
+          setOlderCursor(res.data.next_cursor);
         })
         .catch((err) => console.error(err))
         .finally(() => setIsLoading(false));
     }
   }, [sessionId, accessToken]);
 
+  const handleLoadOlder = async () => {
+    try {
+      const res = await fetchHistory(olderCursor);
+      setMessages((prev) => [...toHistoric(res.data), ...prev]);
+      setOlderCursor(res.data.next_cursor);
+    } catch (err) {
+      console.error(err);
+    }
+  };
+
   const handleSend = async (prompt) => {
     const newUserMessage = { 
       role: 'user', 
@@ -230,7 +247,12 @@ const Chat = () => {
               </Box>
             ) : (
               <>
-                <ChatWindow messages={messages} username={userInfo.username || 'User'} />
+                <ChatWindow
+                  messages={messages}
+                  username={userInfo.username || 'User'}
+                  hasOlder={Boolean(olderCursor)}
+                  onLoadOlder={handleLoadOlder}
+                />
                 <Box sx={{ position: 'relative', mt: 2 }}>
                   <ChatInput onSend={handleSend} isLoading={isLoading} />
                 </Box>